@@ -46,7 +46,8 @@ if not config:
 
     config = {
         "game_directory": first_valid_path(game_folder_paths),
-        "mod_directory": first_valid_path(mod_folders_paths)
+        "mod_directory": first_valid_path(mod_folders_paths),
+        "parse_workers": 0
     }
 
 cache = MyDict()
@@ -0,0 +1,135 @@
+import sys
+from collections.abc import ItemsView, Mapping, MutableMapping, ValuesView
+
+# Nodes with more keys than this also keep a key to position dictionary so lookups don't scan the keys
+LOOKUP_THRESHOLD = 8
+
+
+class CompactNode(MutableMapping):
+    """
+    Mapping with the same behaviour as the dictionaries of the encoder, keys in insertion order, that stores its keys
+    and values in two lists instead of a hash table. Small nodes, which most nodes of a script file are, take up less
+    memory this way.
+    """
+    __slots__ = ("_keys", "_values", "_positions")
+
+    def __init__(self, items=()):
+        self._keys = []
+        self._values = []
+        self._positions = None
+        if isinstance(items, Mapping):
+            items = items.items()
+        for key, value in items:
+            self[key] = value
+
+    def _find(self, key):
+        if self._positions is not None:
+            return self._positions.get(key, -1)
+        try:
+            return self._keys.index(key)
+        except ValueError:
+            return -1
+
+    def __getitem__(self, key):
+        position = self._find(key)
+        if position == -1:
+            raise KeyError(key)
+        return self._values[position]
+
+    def __setitem__(self, key, value):
+        position = self._find(key)
+        if position != -1:
+            self._values[position] = value
+            return
+        if self._positions is not None:
+            self._positions[key] = len(self._keys)
+        self._keys.append(key)
+        self._values.append(value)
+        if self._positions is None and len(self._keys) > LOOKUP_THRESHOLD:
+            self._positions = {key: position for position, key in enumerate(self._keys)}
+
+    def __delitem__(self, key):
+        position = self._find(key)
+        if position == -1:
+            raise KeyError(key)
+        del self._keys[position]
+        del self._values[position]
+        if self._positions is not None:
+            if len(self._keys) > LOOKUP_THRESHOLD:
+                self._positions = {key: position for position, key in enumerate(self._keys)}
+            else:
+                self._positions = None
+
+    def __contains__(self, key):
+        return self._find(key) != -1
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def items(self):
+        return _CompactItemsView(self)
+
+    def values(self):
+        return _CompactValuesView(self)
+
+    def copy(self):
+        return CompactNode(self.items())
+
+    def __reduce__(self):
+        return CompactNode, (list(self.items()),)
+
+    def __repr__(self):
+        return "CompactNode({" + ", ".join(f"{key!r}: {value!r}" for key, value in self.items()) + "})"
+
+
+class _CompactItemsView(ItemsView):
+    """
+    ItemsView iterating the two lists of a CompactNode directly instead of looking every key up.
+    """
+    __slots__ = ()
+
+    def __iter__(self):
+        return zip(self._mapping._keys, self._mapping._values)
+
+
+class _CompactValuesView(ValuesView):
+    __slots__ = ()
+
+    def __iter__(self):
+        return iter(self._mapping._values)
+
+
+def compact(value):
+    """
+    Convert an encoded dictionary into CompactNode objects, interning every key and string value along the way so
+    the names and enum like values repeated throughout the game files are stored once.
+    """
+    if isinstance(value, dict):
+        node = CompactNode()
+        keys = node._keys
+        values = node._values
+        for key, item in value.items():
+            keys.append(sys.intern(key) if type(key) == str else key)
+            values.append(compact(item))
+        if len(keys) > LOOKUP_THRESHOLD:
+            node._positions = {key: position for position, key in enumerate(keys)}
+        return node
+    if type(value) == list:
+        return [compact(item) for item in value]
+    if type(value) == str:
+        return sys.intern(value)
+    return value
+
+
+def expand(value):
+    """
+    Convert CompactNode objects back into plain dictionaries.
+    """
+    if isinstance(value, CompactNode):
+        return {key: expand(item) for key, item in value.items()}
+    if type(value) == list:
+        return [expand(item) for item in value]
+    return value
@@ -18,6 +18,7 @@ class Constants:
     GREATER_TYPE = 10
     EQUAL_AND_EXISTS_TYPE = 11
     NOT_EQUAL_TYPE = 12
+    END_OF_FILE_TYPE = 13
 
 
 class Test:
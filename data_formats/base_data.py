@@ -1,6 +1,9 @@
 import copy
+import functools
 import os
-from parse_encoder import parse_text_file
+from config import load_configurations
+from parse_cache import parse_cache
+from parse_encoder import parse_text_file, type_values
 from deepdiff import DeepDiff
 from deepdiff.path import _path_to_elements, extract
 from data_utils import set_nested_obj, exclude_int_keys_callback, del_nested_obj
@@ -9,6 +12,19 @@ from data_utils import set_nested_obj, exclude_int_keys_callback, del_nested_obj
 class DataFormat:
     relative_file_location = ""
     prefixes = []
+    # Processes parsing the files not found in the parse cache, 0 parses them one after another. Set by "parse_workers"
+    # in the config file
+    parse_workers = load_configurations().get("parse_workers", 0)
+    # Below this many files to parse a process pool costs more than it saves
+    parallel_min_files = 8
+    # Convert numeric values to int and float once while parsing instead of in every consumer. Only for formats that
+    # are read, not for those whose export compares values edited as strings against the parsed files, like
+    # BuyPackages, which writes its data frame back as strings with "0" for a dropped value
+    typed_values = False
+    # Parse with the comments in a table next to the data (parse_text_file's comment_table) instead of under integer
+    # keys, so interpret only copies the entries it marks instead of filtering every node, and the diffs of
+    # update_if_needed don't skip them. Exported comments stay next to the keys they were written by
+    comment_table = False
 
     def __init__(self, game_folder: str, mod_folder: str, prefixes: list = None):
         self.data = {}
@@ -47,6 +63,15 @@ class DataFormat:
         else:
             return item
 
+    @staticmethod
+    def copy_entries(dictionary):
+        """
+        Copy of a dictionary parsed with comment_table with copies of its entries, which add_file_location marks,
+        sharing the nodes in them.
+        """
+        return {key: [dict(entry) for entry in value] if isinstance(value, list) else dict(value)
+                for key, value in dictionary.items()}
+
     @staticmethod
     def add_file_location(dictionary, file_path):
         for key, value in dictionary.items():
@@ -62,37 +87,57 @@ class DataFormat:
         for key, value in dictionary.items():
             del value["_source"]
 
+    @classmethod
+    def parse_files(cls, file_paths):
+        """
+        Parse files through the parse cache, returning their dictionaries in the order of file_paths.
+        The files missing from the cache are parsed in parallel when parse_workers is set.
+        Numeric values are converted after caching when typed_values is set.
+        """
+        kind = "commented" if cls.comment_table else "dictionary"
+        parse = functools.partial(parse_text_file, comment_table=True) if cls.comment_table else parse_text_file
+        dictionaries = parse_cache.parse_text_files(file_paths, parse, kind, cls.parse_workers, cls.parallel_min_files)
+        if cls.typed_values:
+            for dictionary in dictionaries:
+                type_values(dictionary)
+        return dictionaries
+
+    @staticmethod
+    def _text_files(walk):
+        return [(dirpath, filename, os.path.normpath(os.path.join(dirpath, filename)))
+                for dirpath, _, filenames in walk for filename in filenames if filename.endswith('.txt')]
+
     def interpret(self):
 
         if self.mod_folder:
             mod_folder_walk = list(os.walk(self.mod_folder))
             overwritten_files = {os.path.basename(dirpath): filenames for (dirpath, _, filenames) in mod_folder_walk}
+            mod_files = self._text_files(mod_folder_walk)
         else:
             overwritten_files = {}
-
-        for dirpath, _, filenames in os.walk(self.game_folder):
-            for filename in filenames:
-                if filename.endswith('.txt'):
-                    file_path = os.path.normpath(os.path.join(dirpath, filename))
-                    dictionary = parse_text_file(file_path)
-                    self._game_dictionary[file_path] = dictionary
-                    # If not being overwritten by file name then add entries to general data
-                    if filename not in overwritten_files.get(os.path.basename(dirpath), []):
-                        dictionary = DataFormat.copy_dict_with_string_keys(dictionary)
-                        self.add_file_location(dictionary, file_path)
-                        self.data_refs.update(dictionary)
-
-        if self.mod_folder:
-            for dirpath, _, filenames in mod_folder_walk:
-                for filename in filenames:
-                    if filename.endswith('.txt'):
-                        file_path = os.path.normpath(os.path.join(dirpath, filename))
-                        dictionary = parse_text_file(file_path)
-                        self._mod_dictionary[file_path] = dictionary
-
-                        dictionary = DataFormat.copy_dict_with_string_keys(dictionary)
-                        self.add_file_location(dictionary, file_path)
-                        self.data_refs.update(dictionary)
+            mod_files = []
+        game_files = self._text_files(os.walk(self.game_folder))
+
+        # Parse everything up front, the merging below stays in walk order so mods keep overriding the game
+        dictionaries = self.parse_files([file_path for _, _, file_path in game_files + mod_files])
+        game_dictionaries = dictionaries[:len(game_files)]
+        mod_dictionaries = dictionaries[len(game_files):]
+
+        copy_entries = DataFormat.copy_entries if self.comment_table else DataFormat.copy_dict_with_string_keys
+        for (dirpath, filename, file_path), dictionary in zip(game_files, game_dictionaries):
+            self._game_dictionary[file_path] = dictionary
+            # If not being overwritten by file name then add entries to general data
+            if filename not in overwritten_files.get(os.path.basename(dirpath), []):
+                dictionary = copy_entries(dictionary)
+                self.add_file_location(dictionary, file_path)
+                self.data_refs.update(dictionary)
+
+        for (_, _, file_path), dictionary in zip(mod_files, mod_dictionaries):
+            self._mod_dictionary[file_path] = dictionary
+
+            dictionary = copy_entries(dictionary)
+            self.add_file_location(dictionary, file_path)
+            self.data_refs.update(dictionary)
 
         DataFormat.copy_dict_with_string_keys(self.data_refs, self._prefix_manager)
         self.data = copy.deepcopy(self.data_refs)
@@ -110,18 +155,20 @@ class DataFormat:
 
         for key, value in data.items():
             path_string = self.data_refs[key]["_source"]
+            # a file holding nothing but comments is empty as a dictionary, it's still there
             if self.game_folder in path_string:
-                if not formatted_game_data.get(path_string):
+                if path_string not in formatted_game_data:
                     formatted_game_data[path_string] = {}
                 formatted_game_data[path_string][key] = value
 
             if self.mod_folder in path_string:
-                if not formatted_mod_data.get(path_string):
+                if path_string not in formatted_mod_data:
                     formatted_mod_data[path_string] = {}
                 formatted_mod_data[path_string][key] = value
 
-        game_diff = DeepDiff(self._game_dictionary, formatted_game_data, exclude_obj_callback=exclude_int_keys_callback)
-        mod_diff = DeepDiff(self._mod_dictionary, formatted_mod_data, exclude_obj_callback=exclude_int_keys_callback)
+        exclude_callback = None if self.comment_table else exclude_int_keys_callback
+        game_diff = DeepDiff(self._game_dictionary, formatted_game_data, exclude_obj_callback=exclude_callback)
+        mod_diff = DeepDiff(self._mod_dictionary, formatted_mod_data, exclude_obj_callback=exclude_callback)
         for type_name, differences in list(game_diff.items()):
             if type_name == "dictionary_item_added" or type_name == "dictionary_item_removed":
                 for index, dict_path in list(enumerate(differences)):
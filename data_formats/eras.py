@@ -5,6 +5,8 @@ import os
 class Eras(DataFormat):
     prefixes = ["era"]
     relative_file_location = os.path.normpath("common/technology/eras")
+    # technology_cost is summed by Technologies.calc_category_cost
+    typed_values = True
 
     def __init__(self, game_folder: str, mod_folder: str, prefixes: list = None):
         if not prefixes:
@@ -42,7 +42,7 @@ class Technologies(DataFormat):
         category_costs = {}
         for category in unique_categories:
             category_entries = [d for d in self.data.values() if d.get("category") == category]
-            total_cost = sum([float(entry["era"]["technology_cost"]) for entry in category_entries if "era" in entry])
+            total_cost = sum([entry["era"]["technology_cost"] for entry in category_entries if "era" in entry])
             category_costs[category] = total_cost
 
         return category_costs
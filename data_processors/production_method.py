@@ -45,7 +45,7 @@ class ProductionMethod:
 
     def interpret(self):
         def handle_modifier(tmp_data, modifier_value, scope_name, scale_name, modifier_name):
-            # Skip over keys that are integers (representing comment lines)
+            # Skip over keys that are integers, comment lines of data parsed without a comment table
             if isinstance(modifier_name, int):
                 return
 
@@ -0,0 +1,51 @@
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import Test
+from parse_encoder import parse_text_file
+
+
+def text_files(folder):
+    return [os.path.join(dirpath, filename)
+            for dirpath, _, filenames in os.walk(folder) for filename in filenames if filename.endswith(".txt")]
+
+
+def measure(file_paths, compact):
+    """
+    Parse every file and keep the results, returning the memory they take up and the seconds it took.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    dictionaries = [parse_text_file(file_path, compact=compact) for file_path in file_paths]
+    seconds = time.perf_counter() - start
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del dictionaries
+    return size, peak, seconds
+
+
+def run(folder):
+    """
+    Compare the memory of the dictionary and the compact backends holding every parsed file of folder.
+    """
+    file_paths = text_files(folder)
+    print(f"{len(file_paths)} files in {folder}")
+    print(f"{'backend':>10} {'retained MB':>12} {'peak MB':>10} {'seconds':>10}")
+    results = {}
+    for name, compact in (("dict", False), ("compact", True)):
+        size, peak, seconds = measure(file_paths, compact)
+        results[name] = size
+        print(f"{name:>10} {size / 2 ** 20:>12.2f} {peak / 2 ** 20:>10.2f} {seconds:>10.2f}")
+    if results["dict"]:
+        print(f"compact retains {results['compact'] / results['dict']:.0%} of the dict backend")
+
+
+if __name__ == '__main__':
+    run(sys.argv[1] if len(sys.argv) > 1 else os.path.join(Test.game_directory, "common"))
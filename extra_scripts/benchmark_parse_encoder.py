@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parse_encoder import parse_text
+
+ENTRY = """production_method_{index} = {{
+\ttexture = "gfx/interface/icons/production_method_icons/pm_{index}.dds" # icon
+\tunlocking_technologies = {{
+\t\tmanufacturies
+\t}}
+\tbuilding_modifiers = {{
+\t\tworkforce_scaled = {{
+\t\t\tbuilding_input_grain_add = 10
+\t\t\tbuilding_output_fabric_add = 25
+\t\t}}
+\t\t# employment
+\t\tlevel_scaled = {{
+\t\t\tbuilding_employment_laborers_add = 4000
+\t\t\tbuilding_employment_machinists_add = 500
+\t\t}}
+\t}}
+}}
+
+"""
+
+
+def synthetic_file(entries):
+    return "".join(ENTRY.format(index=index) for index in range(entries))
+
+
+def time_parse(file_string, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse_text(file_string)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(start_entries=500, doublings=6):
+    """
+    Time parse_text on a synthetic file that doubles in size every step.
+    A linear time encoder keeps the ratio to the previous step close to 2.
+    """
+    print(f"{'entries':>10} {'bytes':>12} {'seconds':>10} {'ratio':>7}")
+    previous = None
+    entries = start_entries
+    for _ in range(doublings):
+        file_string = synthetic_file(entries)
+        seconds = time_parse(file_string)
+        ratio = f"{seconds / previous:.2f}" if previous else "-"
+        print(f"{entries:>10} {len(file_string):>12} {seconds:>10.4f} {ratio:>7}")
+        previous = seconds
+        entries *= 2
+
+
+if __name__ == '__main__':
+    run()
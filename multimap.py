@@ -0,0 +1,103 @@
+from collections.abc import MutableMapping
+
+
+class MultiMap(MutableMapping):
+    """
+    Ordered mapping that keeps every value of a repeated key, for the encoder's multimap mode. Indexing and iteration
+    see each key once with its first value, get_all and all_items see every value, the latter in the order they were
+    added across keys. Until a key repeats everything lives in a single dict.
+    """
+    __slots__ = ("_first", "_all", "_order")
+
+    def __init__(self, items=()):
+        self._first = {}
+        self._all = None  # key to all its values, for the keys that repeat, once one does
+        self._order = None  # (key, occurrence) of every value, once a key repeats
+        for key, value in items:
+            self.add(key, value)
+
+    def add(self, key, value):
+        first = self._first
+        if key not in first:
+            first[key] = value
+            if self._order is not None:
+                self._order.append((key, 0))
+            return
+        if self._all is None:
+            self._all = {}
+            self._order = [(existing, 0) for existing in first]
+        values = self._all.get(key)
+        if values is None:
+            values = self._all[key] = [first[key]]
+        values.append(value)
+        self._order.append((key, len(values) - 1))
+
+    def get_first(self, key, default=None):
+        return self._first.get(key, default)
+
+    def get_all(self, key):
+        """
+        Every value of key in the order they were added, the list kept for a repeated key itself, which is not to be
+        changed.
+        """
+        if self._all is not None:
+            values = self._all.get(key)
+            if values is not None:
+                return values
+        if key in self._first:
+            return [self._first[key]]
+        return []
+
+    def count(self, key):
+        return len(self.get_all(key))
+
+    def all_items(self):
+        if self._order is None:
+            return iter(self._first.items())
+        return ((key, self._all[key][occurrence] if key in self._all else self._first[key])
+                for key, occurrence in self._order)
+
+    def _drop_repeats(self, key):
+        if self._all is not None and key in self._all:
+            del self._all[key]
+            self._order = [(other, occurrence) for other, occurrence in self._order
+                           if other != key or occurrence == 0]
+
+    def __getitem__(self, key):
+        return self._first[key]
+
+    def __setitem__(self, key, value):
+        """
+        Replace every value of key by value, keeping the position of its first value.
+        """
+        if key in self._first:
+            self._drop_repeats(key)
+            self._first[key] = value
+        else:
+            self.add(key, value)
+
+    def __delitem__(self, key):
+        del self._first[key]
+        self._drop_repeats(key)
+        if self._order is not None:
+            self._order = [(other, occurrence) for other, occurrence in self._order if other != key]
+
+    def __contains__(self, key):
+        return key in self._first
+
+    def __iter__(self):
+        return iter(self._first)
+
+    def __len__(self):
+        return len(self._first)
+
+    def __eq__(self, other):
+        if isinstance(other, MultiMap):
+            return list(self.all_items()) == list(other.all_items())
+        return super().__eq__(other)
+
+    def __reduce__(self):
+        return MultiMap, (list(self.all_items()),)
+
+    def __repr__(self):
+        return "MultiMap([" + ", ".join(f"({key!r}, {value!r})" for key, value in self.all_items()) + "])"
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from config import CONFIG_FOLDER
+from parser.file_utils import atomic_write
+from parse_encoder import build_entry_index, parse_entry, parse_text_file
+
+CACHE_FOLDER = os.path.join(CONFIG_FOLDER, "parse_cache")
+# Bump whenever the encoder output changes, entries of other versions are treated as misses
+CACHE_VERSION = 5
+# file name suffix of every kind of entry, commented is the dictionary parsed with comment_table
+ENTRY_KINDS = {"dictionary": ".pickle", "commented": ".commented.pickle", "index": ".index.pickle"}
+
+
+class ParseCache:
+    """
+    Persistent cache of parse_text_file results. Every file gets an entry holding its fingerprint (path, size,
+    modification time and content hash) and its encoded dictionary, and another one for its entry index when that is
+    asked for. Entries are evicted least recently used first once the cache grows over max_size bytes.
+    """
+
+    def __init__(self, folder: str = CACHE_FOLDER, max_size: int = 256 * 1024 * 1024):
+        self.folder = folder
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # bytes taken up by the entries, counted when first needed
+
+    def parse_text_file(self, file_path):
+        dictionary = self.get(file_path)
+        if dictionary is None:
+            dictionary = parse_text_file(file_path)
+            self.put(file_path, dictionary)
+        return dictionary
+
+    def parse_text_files(self, file_paths, parse=None, kind="dictionary", workers=0, min_files=8):
+        """
+        parse(file_path), parse_text_file by default, of every file as a list in the order of file_paths, through the
+        cache entries of kind. With workers the files missing from the cache are parsed in a pool of that many
+        processes, when there are at least min_files of them, below which starting the pool costs more than it saves.
+        """
+        if parse is None:
+            parse = parse_text_file
+        dictionaries = {}
+        missing = []
+        for file_path in file_paths:
+            dictionary = self.get(file_path, kind=kind)
+            if dictionary is None:
+                missing.append(file_path)
+            else:
+                dictionaries[file_path] = dictionary
+
+        if workers and len(missing) >= min_files:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(parse, missing))
+        else:
+            parsed = [parse(file_path) for file_path in missing]
+
+        for file_path, dictionary in zip(missing, parsed):
+            self.put(file_path, dictionary, kind=kind)
+            dictionaries[file_path] = dictionary
+        return [dictionaries[file_path] for file_path in file_paths]
+
+    def entry_index(self, file_path):
+        """
+        The build_entry_index index of a file, kept next to its dictionary.
+        """
+        index = self.get(file_path, kind="index")
+        if index is None:
+            index = build_entry_index(file_path)
+            self.put(file_path, index, kind="index")
+        return index
+
+    def parse_entry(self, file_path, key):
+        return parse_entry(file_path, key, self.entry_index(file_path))
+
+    def get(self, file_path, kind="dictionary"):
+        """
+        Return the cached dictionary (or another kind of value) of a file, or None when the file changed or was never
+        cached.
+        """
+        entry_path = self._entry_path(file_path, kind)
+        try:
+            with open(entry_path, "rb") as file:
+                header = pickle.load(file)
+                if self._is_valid(header, file_path):
+                    value = pickle.load(file)
+                else:
+                    value = None
+        except (OSError, pickle.UnpicklingError, EOFError):
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        os.utime(entry_path)  # the modification time of an entry marks when it was last used
+        return value
+
+    def put(self, file_path, value, kind="dictionary"):
+        stat = os.stat(file_path)
+        header = {"version": CACHE_VERSION, "path": os.path.abspath(file_path), "size": stat.st_size,
+                  "mtime": stat.st_mtime_ns, "hash": self._hash_file(file_path)}
+
+        entry_path = self._entry_path(file_path, kind)
+        size = self._current_size()
+        if os.path.exists(entry_path):
+            size -= os.path.getsize(entry_path)
+        atomic_write(entry_path, pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL) +
+                     pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+        self._size = size + os.path.getsize(entry_path)
+        if self._size > self.max_size:
+            self._evict(keep=entry_path)
+
+    def invalidate(self, file_path=None):
+        """
+        Remove the entries of a file, or every entry when no file is given.
+        """
+        if file_path is not None:
+            entry_paths = [self._entry_path(file_path, kind) for kind in ENTRY_KINDS]
+        else:
+            entry_paths = [path for path, _, _ in self._entries()]
+
+        for entry_path in entry_paths:
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+        self._size = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0,
+            "size": self._current_size(),
+            "max_size": self.max_size
+        }
+
+    def _is_valid(self, header, file_path):
+        if header.get("version") != CACHE_VERSION or header.get("path") != os.path.abspath(file_path):
+            return False
+        stat = os.stat(file_path)
+        if header["size"] != stat.st_size:
+            return False
+        if header["mtime"] == stat.st_mtime_ns:
+            return True
+        # touched but possibly unchanged, for example by a checkout, so let the content decide
+        return header["hash"] == self._hash_file(file_path)
+
+    def _entry_path(self, file_path, kind="dictionary"):
+        name = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, name + ENTRY_KINDS[kind])
+
+    def _entries(self):
+        """
+        (path, size, last used) of every entry.
+        """
+        if not os.path.isdir(self.folder):
+            return []
+        entries = []
+        with os.scandir(self.folder) as iterator:
+            for dir_entry in iterator:
+                if dir_entry.name.endswith(".pickle"):
+                    stat = dir_entry.stat()
+                    entries.append((dir_entry.path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def _current_size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def _evict(self, keep):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if self._size <= self.max_size:
+                break
+            if entry_path == keep:
+                continue
+            os.remove(entry_path)
+            self._size -= size
+
+    @staticmethod
+    def _hash_file(file_path):
+        digest = hashlib.blake2b()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+parse_cache = ParseCache()
+
+
+def compare_parallel(folder_path, workers=2):
+    """
+    Parse the text files of a folder in a pool of workers and one after another, each into an empty cache, and report
+    the files whose dictionaries differ. Returns the number of those.
+    """
+    import tempfile
+    import time
+
+    file_paths = sorted(os.path.join(dirpath, filename) for dirpath, _, filenames in os.walk(folder_path)
+                        for filename in filenames if filename.endswith(".txt"))
+    results = {}
+    for name, pool_workers in (("serial", 0), ("pool", workers)):
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            results[name] = ParseCache(folder).parse_text_files(file_paths, workers=pool_workers, min_files=1)
+            print(f"{name}: {len(file_paths)} files in {time.perf_counter() - start:.2f} s")
+
+    differing = [file_path for file_path, serial, pool in zip(file_paths, results["serial"], results["pool"])
+                 if serial != pool]
+    for file_path in differing:
+        print(f"differs: {file_path}")
+    return len(differing)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "compare":
+        sys.exit(1 if compare_parallel(sys.argv[2], *map(int, sys.argv[3:4])) else 0)
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        parse_cache.invalidate()
+    print(parse_cache.stats())
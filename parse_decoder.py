@@ -1,9 +1,15 @@
+from collections.abc import Mapping
 from constants import *
+from multimap import MultiMap
 
 
 def decode_dictionary(dictionary, depth=0):
+    if depth == 0 and hasattr(dictionary, "comments"):
+        from parse_encoder import join_comments
+        dictionary = join_comments(dictionary)
     result = ""
-    for key, value in dictionary.items():
+    items = dictionary.all_items() if type(dictionary) == MultiMap else dictionary.items()
+    for key, value in items:
         operator = " = "
         if isinstance(key, tuple):
             if key[-1] == Constants.EQUAL_TYPE:
@@ -21,7 +27,7 @@ def decode_dictionary(dictionary, depth=0):
             elif key[-1] == Constants.NOT_EQUAL_TYPE:
                 operator = " != "
             key = str(key[2])
-        if type(value) == dict:
+        if isinstance(value, Mapping):
             if len(result) >= 2 and result[-2] == "}":
                 result += "\n"
             result += "\t" * depth + key + operator + "{" + "\n"
@@ -32,6 +38,8 @@ def decode_dictionary(dictionary, depth=0):
                 result += decode_dictionary(element, depth + 1)
         elif type(value) == str:
             result += "\t" * depth + key + operator + value + "\n"
+        elif type(value) != bool and isinstance(value, (int, float)):
+            result += "\t" * depth + key + operator + str(value) + "\n"
         elif type(value) == bool:
             result += "\t" * depth + key + "\n"
         elif type(key) == int:
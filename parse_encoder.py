@@ -1,23 +1,104 @@
+import bisect
+import mmap
 import re
+from collections.abc import Mapping
+from itertools import chain
+import compact_tree
+from multimap import MultiMap
 from constants import Constants
 
+# Alternatives of the master tokenizer pattern. Comments are matched here instead of being stripped beforehand, so a
+# quoted word stops at the first "#" of its line and an operator directly followed by a comment only matches when that
+# comment is terminated by a newline, just as if the comment had been removed.
 symbol_searches = [
-    (r"([:\w\.-]+)|(\"[^\n]+\")", Constants.WORD_TYPE),
-    (r"(?<=[^><?])=", Constants.EQUAL_TYPE),
-    (r"{", Constants.BEGIN_DICT_TYPE),
-    (r"}", Constants.END_DICT_TYPE),
-    (r">=", Constants.EQUAL_OR_GREATER_TYPE),
-    (r">(?=[^=])", Constants.GREATER_TYPE),
-    (r"<=", Constants.EQUAL_OR_LESSER_TYPE),
-    (r"<(?=[^=])", Constants.LESSER_TYPE),
-    (r"\?=", Constants.EQUAL_AND_EXISTS_TYPE),
-    (r"\!=", Constants.NOT_EQUAL_TYPE)
+    r"#.*$",  # comment
+    r"[:\w\.-]+|\"[^\n#]+\"",  # word
+    r"=(?<=[^><?]=)",
+    r"{",
+    r"}",
+    r">=",
+    r">(?=[^=#]|#.*\n)",
+    r"<=",
+    r"<(?=[^=#]|#.*\n)",
+    r"\?=",
+    r"\!="
 ]
-
-comment_symbol_searches = [
-    (r"^[ \t]*#.*$", Constants.FULL_LINE_COMMENT_TYPE),
-    (r"#.*$", Constants.ALL_COMMENT_TYPE)
+master_pattern = re.compile("|".join(f"(?:{pattern})" for pattern in symbol_searches), re.MULTILINE)
+# Operators and braces also match inside quoted words, these are scanned for separately within the quoted word.
+operator_pattern = re.compile("|".join(f"(?:{pattern})" for pattern in symbol_searches[2:]))
+
+# Operators and braces are identified by their text, anything else is a word or a comment
+operator_types = {
+    "=": Constants.EQUAL_TYPE,
+    "{": Constants.BEGIN_DICT_TYPE,
+    "}": Constants.END_DICT_TYPE,
+    ">=": Constants.EQUAL_OR_GREATER_TYPE,
+    ">": Constants.GREATER_TYPE,
+    "<=": Constants.EQUAL_OR_LESSER_TYPE,
+    "<": Constants.LESSER_TYPE,
+    "?=": Constants.EQUAL_AND_EXISTS_TYPE,
+    "!=": Constants.NOT_EQUAL_TYPE
+}
+
+
+# Byte counterparts of symbol_searches for tokenizing files without decoding them. A "\r" ends a line like the
+# universal newlines of a text mode file do, and bytes of multibyte characters are taken to be word characters.
+byte_symbol_searches = [
+    rb"#[^\r\n]*",  # comment
+    rb"[:\w\.\x80-\xff-]+|\"[^\r\n#]+\"",  # word
+    rb"=(?<=[^><?]=)",
+    rb"{",
+    rb"}",
+    rb">=",
+    rb">(?=[^=#]|#[^\r\n]*[\r\n])",
+    rb"<=",
+    rb"<(?=[^=#]|#[^\r\n]*[\r\n])",
+    rb"\?=",
+    rb"\!="
 ]
+byte_master_pattern = re.compile(b"|".join(b"(?:" + pattern + b")" for pattern in byte_symbol_searches))
+byte_operator_pattern = re.compile(b"|".join(b"(?:" + pattern + b")" for pattern in byte_symbol_searches[2:]))
+byte_operator_types = {text.encode(): symbol_type for text, symbol_type in operator_types.items()}
+operator_texts = {symbol_type: text for text, symbol_type in operator_types.items()}
+text_word_pattern = re.compile(symbol_searches[1])
+# Matches what a file's text has fewer characters of than its bytes: carriage returns before a newline and the
+# continuation bytes of multibyte characters
+byte_excess_pattern = re.compile(rb"\r(?=\n)|[\x80-\xbf]+")
+utf8_bom = b"\xef\xbb\xbf"
+
+# encode_symbol looks up to four symbols past a word without checking for the end of the file, these pad the symbols
+end_of_file_symbols = [(0, 0, "", Constants.END_OF_FILE_TYPE)] * 4
+
+integer_pattern = re.compile(r"[+-]?\d+")
+decimal_pattern = re.compile(r"[+-]?(?:\d+\.\d*|\.\d+)")
+
+
+class LexemeInt(int):
+    """
+    int remembering its text, for numbers str(int) writes differently like 007 or +5.
+    """
+
+    def __new__(cls, lexeme):
+        number = super().__new__(cls, lexeme)
+        number.lexeme = str(lexeme)
+        return number
+
+    def __str__(self):
+        return self.lexeme
+
+
+class LexemeFloat(float):
+    """
+    float remembering its text, for numbers str(float) writes differently like 1.50 or 2.
+    """
+
+    def __new__(cls, lexeme):
+        number = super().__new__(cls, lexeme)
+        number.lexeme = str(lexeme)
+        return number
+
+    def __str__(self):
+        return self.lexeme
 
 
 def _read_file_as_string(location):
@@ -26,35 +107,289 @@ def _read_file_as_string(location):
     return file_string
 
 
-def parse_text_file(file_path):
+def parse_text_file(file_path, use_mmap=False, compact=False, typed=False, comment_table=False, multimap=False):
+    """
+    Parse a file into a dictionary. With use_mmap the file is memory mapped and tokenized as bytes, decoding only the
+    words and comments, which avoids copying big files into memory as a whole. With compact the result is made of
+    compact_tree.CompactNode mappings instead of dictionaries. With typed numeric values are converted, see
+    type_values. With comment_table the comments are kept out of the data, see CommentedDict. With multimap the
+    result is made of MultiMap nodes keeping every value of repeated keys, which can't be combined with the others.
+    """
+    if use_mmap:
+        symbols = _tokenize_mapped_file(file_path)
+        if symbols is not None:
+            if multimap:
+                _check_multimap(compact, typed, comment_table)
+                return encode_symbols_multimap(symbols)
+            return _encode(symbols, compact, typed, comment_table)
     file_string = _read_file_as_string(file_path)
-    return parse_text(file_string)
-
+    return parse_text(file_string, compact, typed, comment_table, multimap)
+
+
+def parse_text(file_string, compact=False, typed=False, comment_table=False, multimap=False):
+    if multimap:
+        _check_multimap(compact, typed, comment_table)
+        return encode_symbols_multimap(tokenize(file_string))
+    return _encode(tokenize(file_string), compact, typed, comment_table)
+
+
+def _check_multimap(compact, typed, comment_table):
+    if compact or typed or comment_table:
+        raise ValueError("multimap can't be combined with compact, typed or comment_table")
+
+
+def _encode(symbols, compact, typed, comment_table):
+    dictionary = encode_symbols_commented(symbols) if comment_table else encode_symbols(symbols)
+    if typed:
+        type_values(dictionary)
+    if compact:
+        compacted = compact_tree.compact(dictionary)
+        dictionary = CommentedDict(compacted.items(), dictionary.comments) if comment_table else compacted
+    return dictionary
+
+
+class CommentedDict(dict):
+    """
+    Root dictionary of a file whose comments were moved out of the data. comments maps the path of a node, the keys
+    leading to it with list indices for repeated keys, to a list of (key, after, comment symbol) in file order. key is
+    the key the comment is written next to, after when it follows it, on its line or at the end of the node, instead
+    of preceding it, and None in a node without keys. Comments stay with their key when other keys are added or
+    removed, those of a removed key go to the end of the node.
+
+    >>> from parse_decoder import decode_dictionary
+    >>> dictionary = parse_text("# header\\na = 1 # one\\nb = 2\\n# before c\\nc = 3\\n", comment_table=True)
+    >>> dictionary.comments[()][1]
+    ('a', True, (7, 12, '# one', 4))
+    >>> del dictionary["b"]
+    >>> dictionary["d"] = "4"
+    >>> print(decode_dictionary(dictionary), end="")
+    # header
+    a = 1 # one
+    # before c
+    c = 3
+    d = 4
+    """
+
+    def __init__(self, items=(), comments=None):
+        super().__init__(items)
+        self.comments = comments if comments is not None else {}
+
+
+def encode_symbols_commented(symbols):
+    """
+    encode_symbols for comment_table, the comments are kept aside as they're read instead of going into the nodes,
+    giving what split_comments gives for the result of encode_symbols without rebuilding any node.
+    """
+    symbols = symbols + end_of_file_symbols
+    result = {}
+    stack = [result]
+    iteration = [0]
+    commented = {}  # id of a node to the node and the (position, comment symbol) of its comments
+    parents = {}  # id of a block to (node it went in, key, position in the list of the key or None)
+    last = current = None
+
+    def insert_comment(node, _, comment):
+        nonlocal last, current
+        if node is not last:
+            # comments come in runs on the same node, look it up once per run
+            entry = commented.get(id(node))
+            if entry is None:
+                entry = commented[id(node)] = (node, [])
+            last, current = node, entry[1]
+        current.append((len(node), comment))
+
+    def insert(node, key, value):
+        if type(value) != dict:
+            node[key] = value
+            return
+        existing = node.get(key)
+        if not existing and id(existing) not in commented:
+            # a block with nothing but comments isn't empty, as with the comments inline
+            node[key] = value
+            parents[id(value)] = (node, key, None)
+        elif type(existing) == list:
+            existing.append(value)
+            parents[id(value)] = (node, key, len(existing) - 1)
+        else:
+            node[key] = [existing, value]
+            parents[id(value)] = (node, key, 1)
+
+    index = 0
+    while index < len(symbols):
+        index = encode_symbol(symbols, index, stack, iteration, insert, insert_comment)
+    return CommentedDict(result.items(), _comment_paths(result, commented, parents))
+
+
+def _comment_paths(root, commented, parents):
+    """
+    The comments of the commented nodes by their path in root, leaving out those of blocks replaced by a later one.
+    """
+    comments = {}
+    for node, node_comments in commented.values():
+        path = _node_path(node, root, parents)
+        if path is not None:
+            comments[path] = _anchor_comments(list(node), node_comments)
+    return comments
+
+
+def _anchor_comments(keys, node_comments):
+    """
+    Turn the (position, comment symbol) of the comments of a node with keys, position being the number of keys
+    before the comment, into the (key, after, comment symbol) of CommentedDict.
+    """
+    anchored = []
+    for position, comment in node_comments:
+        if not keys:
+            anchored.append((None, False, comment))
+        elif position and (comment[3] == Constants.PART_LINE_COMMENT_TYPE or position == len(keys)):
+            anchored.append((keys[position - 1], True, comment))
+        else:
+            anchored.append((keys[position], False, comment))
+    return anchored
+
+
+def _node_path(node, root, parents):
+    path = ()
+    while node is not root:
+        parent, key, position = parents[id(node)]
+        value = parent.get(key)
+        if value is node:
+            path = (key,) + path
+        elif type(value) == list and (position or 0) < len(value) and value[position or 0] is node:
+            # the first block of a key is at 0 once a second one made a list of them
+            path = (key, position or 0) + path
+        else:
+            return None
+        node = parent
+    return path
+
+
+def split_comments(dictionary):
+    """
+    Return the encoded dictionary without its integer comment keys, as a CommentedDict holding the comments.
+    Nodes with comments are replaced by copies, the others are shared with the dictionary.
+    """
+    comments = {}
+    root = _split_node_comments(dictionary, (), comments)
+    return CommentedDict(root.items(), comments)
+
+
+def _split_node_comments(node, path, comments):
+    items = []
+    node_comments = []
+    changed = False
+    for key, value in node.items():
+        if type(key) == int:
+            node_comments.append((len(items), value))
+            continue
+        if isinstance(value, Mapping):
+            new_value = _split_node_comments(value, path + (key,), comments)
+        elif type(value) == list:
+            new_value = [_split_node_comments(element, path + (key, position), comments)
+                         if isinstance(element, Mapping) else element for position, element in enumerate(value)]
+            if all(new is old for new, old in zip(new_value, value)):
+                new_value = value
+        else:
+            new_value = value
+        changed = changed or new_value is not value
+        items.append((key, new_value))
+
+    if node_comments:
+        comments[path] = _anchor_comments([key for key, _ in items], node_comments)
+    elif not changed:
+        return node
+    return type(node)(items)
+
+
+def join_comments(dictionary):
+    """
+    Put the comments of a CommentedDict back into its nodes as integer keys, giving the dictionaries parse_text gives
+    without comment_table.
+    """
+    return _join_node_comments(dictionary, (), dictionary.comments, [0])
+
+
+def _join_node_comments(node, path, comments, iteration):
+    before = {}
+    after = {}
+    start = []
+    end = []
+    for key, is_after, comment in comments.get(path, ()):
+        if key is None:
+            start.append(comment)
+        elif key not in node:
+            end.append(comment)
+        else:
+            (after if is_after else before).setdefault(key, []).append(comment)
 
-def parse_text(file_string):
-    remove_symbols = []
-    remove_symbols += process_comments(file_string)
-    removed_symbols = sorted(remove_symbols, key=lambda x: x[0])
+    result = {}
 
-    offset = 0
-    for index, symbol in enumerate(removed_symbols):
-        removed_symbols[index] = (symbol[0] - offset, symbol[1] - offset, symbol[2], symbol[3])
-        offset += symbol[1] - symbol[0]  # update offset to account for removed characters
+    def add_comments(node_comments):
+        for comment in node_comments:
+            result[iteration[0]] = comment
+            iteration[0] += 1
 
-    for pattern, symbol_type in comment_symbol_searches:
-        file_string = re.sub(pattern, '', file_string, flags=re.MULTILINE)
+    add_comments(start)
+    for key, value in node.items():
+        add_comments(before.get(key, ()))
+        if isinstance(value, Mapping):
+            value = _join_node_comments(value, path + (key,), comments, iteration)
+        elif type(value) == list:
+            value = [_join_node_comments(element, path + (key, element_position), comments, iteration)
+                     if isinstance(element, Mapping) else element for element_position, element in enumerate(value)]
+        result[key] = value
+        add_comments(after.get(key, ()))
+    add_comments(end)
+    return result
 
-    symbols = []
-    for pattern, symbol_type in symbol_searches:
-        symbols += [(match.start(), match.end(), match.group(), symbol_type) for match in
-                    re.finditer(pattern, file_string)]
 
-    symbols = sorted(symbols + removed_symbols, key=lambda x: x[0])
+def type_values(dictionary):
+    """
+    Replace the numeric values of an encoded dictionary, in place, with int and float values. Numbers written
+    differently than str writes them become LexemeInt or LexemeFloat, so decode_dictionary writes every number back
+    as it was. Returns the dictionary.
+
+    The values of a repeated key can mix numbers and blocks:
+
+    >>> type_values(parse_text("a = 1\\na = { b = 2.5 }"))
+    {'a': [1, {'b': 2.5}]}
+    """
+    for key, value in dictionary.items():
+        if type(value) == str:
+            number = _number(value)
+            if number is not None:
+                dictionary[key] = number
+        elif type(value) == dict:
+            type_values(value)
+        elif type(value) == list:
+            for position, element in enumerate(value):
+                if type(element) == str:
+                    number = _number(element)
+                    if number is not None:
+                        value[position] = number
+                elif type(element) == dict:
+                    type_values(element)
+    return dictionary
+
+
+def _number(text):
+    if integer_pattern.fullmatch(text):
+        number = int(text)
+        return number if str(number) == text else LexemeInt(text)
+    if decimal_pattern.fullmatch(text):
+        number = float(text)
+        return number if str(number) == text else LexemeFloat(text)
+    return None
+
+
+def encode_symbols(symbols):
+    symbols = symbols + end_of_file_symbols
     result = {}
     stack = [result]
     iteration = [0]
-    while symbols:
-        encode_symbol(symbols, stack, iteration)
+    index = 0
+    while index < len(symbols):
+        index = encode_symbol(symbols, index, stack, iteration)
 
     # print(result)
     # for key, value in result.items():
@@ -63,80 +398,453 @@ def parse_text(file_string):
     return result
 
 
-def encode_symbol(symbols, stack, iteration):
-    while symbols and (
-            symbols[0][3] == Constants.PART_LINE_COMMENT_TYPE or symbols[0][3] == Constants.FULL_LINE_COMMENT_TYPE):
-        symbol = symbols.pop(0)
-        stack[-1][iteration[0]] = symbol
-        iteration[0] += 1
+def encode_symbols_multimap(symbols):
+    symbols = symbols + end_of_file_symbols
+    result = MultiMap()
+    stack = [result]
+    iteration = [0]
+    index = 0
+    while index < len(symbols):
+        index = encode_symbol(symbols, index, stack, iteration, MultiMap.add, MultiMap.add)
+    return result
+
+
+def iter_entries(file_path):
+    """
+    Yield (key, value, source_span) for every top level entry of a file as soon as its last symbol has been read.
+    source_span is the (start, end) character range of the entry in the file. Only the entry being read is held in
+    memory, so callers can filter entries or stop early without parsing the whole file.
+    """
+    with open(file_path, encoding='utf-8-sig') as file:
+        yield from iter_text_entries(file)
+
+
+def iter_text_entries(lines):
+    """
+    Yield (key, value, source_span) for every top level entry of a text given as an iterable of lines (newlines kept).
+    Values are the same as those of parse_text, top level comments are skipped.
+    """
+    for key, value, source_span, _ in _iter_text_entries(lines):
+        yield key, value, source_span
+
+
+def _iter_text_entries(lines):
+    """
+    iter_text_entries, also yielding what a parse of the entry's text alone needs to give the same value:
+    (position of its first symbol as tokenize positions it, number of comments before it, whether a word or a closing
+    brace follows it, which makes a lone word at its end an element), or None for an entry missing its closing brace
+    at the end of the text.
+    """
+    symbol_stream = chain(_iter_line_symbols(lines), end_of_file_symbols)
+    window = []  # symbols of the current top level entry and the lookahead encode_symbol needs
+    index = 0
+    removed = 0  # characters taken up by the comments before the window
+    root = {}
+    stack = [root]
+    iteration = [0]
+    entry_start = 0
+    while True:
+        _fill_window(window, index, symbol_stream)
+        if index >= len(window):
+            # an entry missing its closing brace ends with the file
+            if len(stack) > 1:
+                source_span = _original_span(window, entry_start, index, removed)
+                # the rest of the file is inside the entry, only a parse of the whole file gives its value
+                offsets = None
+                for key, value in root.items():
+                    if not isinstance(key, int):
+                        yield key, value, source_span, offsets
+            break
+
+        if len(stack) == 1:
+            entry_start = index
+            comments_before = iteration[0]
+        index = encode_symbol(window, index, stack, iteration)
+        if len(stack) != 1:
+            continue
+
+        entries = [(key, value) for key, value in root.items() if not isinstance(key, int)]
+        if entries:
+            source_span = _original_span(window, entry_start, index, removed)
+            offsets = _entry_offsets(window, entry_start, index, comments_before)
+            for key, value in entries:
+                yield key, value, source_span, offsets
+        root.clear()
+
+        for symbol in window[:index]:
+            if symbol[3] == Constants.PART_LINE_COMMENT_TYPE or symbol[3] == Constants.FULL_LINE_COMMENT_TYPE:
+                removed += symbol[1] - symbol[0]
+        del window[:index]
+        index = 0
+
+
+def _entry_offsets(window, start, end, comments_before):
+    """
+    The offsets _iter_text_entries yields for the entry of window[start:end], given the number of comments before
+    window[start].
+    """
+    symbol_start = 0
+    for symbol in window[start:end]:
+        if symbol[3] != Constants.PART_LINE_COMMENT_TYPE and symbol[3] != Constants.FULL_LINE_COMMENT_TYPE:
+            symbol_start = symbol[0]
+            break
+        comments_before += 1
+    followed = False
+    for symbol in window[end:]:
+        if symbol[3] != Constants.PART_LINE_COMMENT_TYPE and symbol[3] != Constants.FULL_LINE_COMMENT_TYPE:
+            followed = symbol[3] == Constants.WORD_TYPE or symbol[3] == Constants.END_DICT_TYPE
+            break
+    return symbol_start, comments_before, followed
+
+
+def build_entry_index(file_path):
+    """
+    Index the top level entries of a file for parse_entry. Returns a list of (key, byte_start, byte_end, first_line,
+    last_line, offsets) in file order, lines counting from 1. offsets is what parse_entry needs to parse the entry by
+    itself the same as in the whole file, None when it can't.
+    """
+    with open(file_path, "rb") as file:
+        data = file.read()
+    offset = len(utf8_bom) if data.startswith(utf8_bom) else 0
+
+    # the encoder works on text with "\n" line endings, remember where each of those lines starts in the file
+    lines = []
+    char_starts = []
+    byte_starts = []
+    char_position = 0
+    byte_position = offset
+    for line in data[offset:].splitlines(keepends=True):
+        text = line.decode()
+        stripped = text.rstrip("\r\n")
+        if len(stripped) != len(text):
+            text = stripped + "\n"
+        lines.append(text)
+        char_starts.append(char_position)
+        byte_starts.append(byte_position)
+        char_position += len(text)
+        byte_position += len(line)
+
+    def locate(position):
+        line = bisect.bisect_right(char_starts, position) - 1
+        column = position - char_starts[line]
+        return line, byte_starts[line] + len(lines[line][:column].encode())
+
+    index = []
+    for key, _, (char_start, char_end), offsets in _iter_text_entries(lines):
+        first_line, byte_start = locate(char_start)
+        last_line, _ = locate(char_end - 1)
+        _, byte_end = locate(char_end)
+        index.append((key, byte_start, byte_end, first_line + 1, last_line + 1, offsets))
+    return index
+
+
+def parse_entry(file_path, key, index=None):
+    """
+    Parse only the top level entry key of a file, reading its bytes through an index of build_entry_index.
+    The result is the one parse_text_file gives the key, including a key defined more than once, with the positions
+    of comments and comparison keys those in the whole file. An entry missing its closing brace at the end of the file
+    takes in everything after it, the whole file is parsed for that one. Returns None when the file has no such entry.
+
+    >>> import os, tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> file_path = os.path.join(folder, "entries.txt")
+    >>> with open(file_path, "w") as file:
+    ...     _ = file.write("a = { b = 1 } # done\\nc = { d = 2 # open\\n  e = 3\\n")
+    >>> parse_entry(file_path, "a") == parse_text_file(file_path)["a"]
+    True
+    >>> parse_entry(file_path, "c") == parse_text_file(file_path)["c"]
+    True
+    >>> parse_entry(file_path, "c")
+    {'d': '2', 1: (27, 33, '# open', 4), 'e': '3'}
+    """
+    if index is None:
+        index = build_entry_index(file_path)
+    entries = [entry for entry in index if entry[0] == key]
+    if not entries:
+        return None
+    if any(entry[5] is None for entry in entries):
+        return parse_text_file(file_path).get(key)
 
-    if not symbols:
+    result = {}
+    stack = [result]
+    with open(file_path, "rb") as file:
+        for _, byte_start, byte_end, _, _, (symbol_start, comments_before, followed) in entries:
+            file.seek(byte_start)
+            text = file.read(byte_end - byte_start).decode().replace("\r\n", "\n").replace("\r", "\n")
+            # the entry's text alone positions its symbols from 0 and numbers its comments from 0
+            symbols = [(start + symbol_start, end + symbol_start, symbol_text, symbol_type)
+                       for start, end, symbol_text, symbol_type in tokenize(text)]
+            if followed:
+                # stands in for the word after the entry, which encodes nothing by itself
+                symbols.append((0, 0, "", Constants.WORD_TYPE))
+            symbols += end_of_file_symbols
+            iteration = [comments_before]
+            symbol_index = 0
+            while symbol_index < len(symbols):
+                symbol_index = encode_symbol(symbols, symbol_index, stack, iteration)
+            del stack[1:]
+    return result.get(key)
+
+
+def _iter_line_symbols(lines):
+    """
+    Yield the symbols of a text given line by line, positioned the same as tokenize positions them.
+    """
+    symbols = []
+    shift = 0
+    first_line = True
+    for line in lines:
+        pos = 0
+        if not first_line and line.startswith("="):
+            # the lookbehind of the equal sign can't see the newline that ended the previous line
+            symbols.append((shift, shift + 1, "=", Constants.EQUAL_TYPE))
+            pos = 1
+        shift = _scan_symbols(line, pos, shift, symbols) + len(line)
+        first_line = False
+
+        yield from symbols
+        symbols.clear()
+
+
+def _fill_window(window, index, symbol_stream):
+    # encode_symbol reads a word, its comments and at most four symbols after those
+    lookahead = 0
+    for position in range(index, len(window)):
+        if window[position][3] != Constants.PART_LINE_COMMENT_TYPE and \
+                window[position][3] != Constants.FULL_LINE_COMMENT_TYPE:
+            lookahead += 1
+    if lookahead >= 5:
         return
+    for symbol in symbol_stream:
+        window.append(symbol)
+        if symbol[3] != Constants.PART_LINE_COMMENT_TYPE and symbol[3] != Constants.FULL_LINE_COMMENT_TYPE:
+            lookahead += 1
+        if lookahead >= 5:
+            break
+
+
+def _original_span(window, start, end, removed):
+    """
+    The character range in the original text from the first to the last non comment symbol of window[start:end].
+    """
+    span_start = span_end = None
+    for position, symbol in enumerate(window[:end]):
+        if symbol[3] == Constants.PART_LINE_COMMENT_TYPE or symbol[3] == Constants.FULL_LINE_COMMENT_TYPE:
+            removed += symbol[1] - symbol[0]
+        elif position >= start:
+            if span_start is None:
+                span_start = symbol[0] + removed
+            # symbols inside quoted words end before the quoted word does
+            span_end = max(span_end or 0, symbol[1] + removed)
+    return span_start, span_end
+
+
+def insert_value(dictionary, key, value):
+    """
+    Put a value under a key of an encoded dictionary. A block under a key that has one already is added to a list of
+    them, anything else replaces what the key had.
+    """
+    if type(value) is not dict or not dictionary.get(key):
+        dictionary[key] = value
+    elif type(dictionary[key]) == list:
+        dictionary[key].append(value)
+    else:
+        dictionary[key] = [dictionary[key], value]
+
+
+def encode_symbol(symbols, index, stack, iteration, insert=insert_value, insert_comment=insert_value):
+    """
+    Encode the statement starting at symbols[index] into the node on top of the stack, through insert(node, key,
+    value), and comments through insert_comment(node, iteration, comment symbol). New blocks are nodes of the type of
+    the one they're in, MultiMap nodes take MultiMap.add for both.
+    Returns the index of the first symbol after the statement.
+    """
+    while index < len(symbols) and (
+            symbols[index][3] == Constants.PART_LINE_COMMENT_TYPE or
+            symbols[index][3] == Constants.FULL_LINE_COMMENT_TYPE):
+        insert_comment(stack[-1], iteration[0], symbols[index])
+        iteration[0] += 1
+        index += 1
+
+    if index >= len(symbols):
+        return index
 
-    symbol = symbols.pop(0)
+    symbol = symbols[index]
+    index += 1
     if symbol[3] == Constants.WORD_TYPE:
         comments = []
-        while symbols[0][3] == Constants.PART_LINE_COMMENT_TYPE or symbols[0][3] == Constants.FULL_LINE_COMMENT_TYPE:
-            comments.append(symbols.pop(0))
-
-        if symbols[0][3] == Constants.EQUAL_TYPE or \
-                symbols[0][3] == Constants.GREATER_TYPE or symbols[0][3] == Constants.EQUAL_OR_LESSER_TYPE or \
-                symbols[0][3] == Constants.LESSER_TYPE or symbols[0][3] == Constants.EQUAL_AND_EXISTS_TYPE:
-            if symbols[1][3] == Constants.BEGIN_DICT_TYPE:
-                dictionary = dict()
-                if not stack[-1].get(symbol[2]):
-                    stack[-1][symbol[2]] = dictionary
-                elif type(stack[-1][symbol[2]]) == list:
-                    stack[-1][symbol[2]].append(dictionary)
-                else:
-                    stack[-1][symbol[2]] = [stack[-1][symbol[2]], dictionary]
-
-                stack.append(dictionary)
-            elif symbols[1][3] == Constants.WORD_TYPE:
-                stack[-1][symbol[2]] = symbols[1][2]
-            symbols.pop(0)
-            symbols.pop(0)
-        elif symbols[0][3] == Constants.WORD_TYPE or symbols[0][3] == Constants.END_DICT_TYPE:
-            stack[-1][symbol[2]] = True
-
-        if symbols[0][3] == Constants.EQUAL_OR_GREATER_TYPE or \
-                symbols[0][3] == Constants.GREATER_TYPE or symbols[0][3] == Constants.EQUAL_OR_LESSER_TYPE or \
-                symbols[0][3] == Constants.LESSER_TYPE or symbols[0][3] == Constants.EQUAL_AND_EXISTS_TYPE:
-            symbol = symbol + tuple([symbols[0][3]])
-            if symbols[1][3] == Constants.BEGIN_DICT_TYPE:
-                if not stack[-1].get(symbol):
-                    stack[-1][symbol] = dictionary
-                elif type(stack[-1][symbol]) == list:
-                    stack[-1][symbol].append(dictionary)
-                else:
-                    stack[-1][symbol] = [stack[-1][symbol], dictionary]
-
-                stack.append(dictionary)
-            elif symbols[1][3] == Constants.WORD_TYPE:
-                stack[-1][symbol] = symbols[1][2]
-            symbols.pop(0)
-            symbols.pop(0)
+        while symbols[index][3] == Constants.PART_LINE_COMMENT_TYPE or \
+                symbols[index][3] == Constants.FULL_LINE_COMMENT_TYPE:
+            comments.append(symbols[index])
+            index += 1
+
+        if symbols[index][3] == Constants.EQUAL_TYPE or \
+                symbols[index][3] == Constants.GREATER_TYPE or symbols[index][3] == Constants.EQUAL_OR_LESSER_TYPE or \
+                symbols[index][3] == Constants.LESSER_TYPE or symbols[index][3] == Constants.EQUAL_AND_EXISTS_TYPE:
+            if symbols[index + 1][3] == Constants.BEGIN_DICT_TYPE:
+                node = type(stack[-1])()
+                insert(stack[-1], symbol[2], node)
+                stack.append(node)
+            elif symbols[index + 1][3] == Constants.WORD_TYPE:
+                insert(stack[-1], symbol[2], symbols[index + 1][2])
+            index += 2
+        elif symbols[index][3] == Constants.WORD_TYPE or symbols[index][3] == Constants.END_DICT_TYPE:
+            insert(stack[-1], symbol[2], True)
+
+        if symbols[index][3] == Constants.EQUAL_OR_GREATER_TYPE or \
+                symbols[index][3] == Constants.GREATER_TYPE or symbols[index][3] == Constants.EQUAL_OR_LESSER_TYPE or \
+                symbols[index][3] == Constants.LESSER_TYPE or symbols[index][3] == Constants.EQUAL_AND_EXISTS_TYPE:
+            symbol = symbol + tuple([symbols[index][3]])
+            if symbols[index + 1][3] == Constants.BEGIN_DICT_TYPE:
+                node = type(stack[-1])()
+                insert(stack[-1], symbol, node)
+                stack.append(node)
+            elif symbols[index + 1][3] == Constants.WORD_TYPE:
+                insert(stack[-1], symbol, symbols[index + 1][2])
+            index += 2
 
         for comment in comments:
-            stack[-1][iteration[0]] = comment
+            insert_comment(stack[-1], iteration[0], comment)
             iteration[0] += 1
 
     elif symbol[3] == Constants.END_DICT_TYPE:
         stack.pop()
 
+    return index
 
-def process_comments(file_string):
-    comment_symbols = []
-    comment_symbols += [(match.start(), match.end(), match.group(), Constants.FULL_LINE_COMMENT_TYPE) for match in
-                        re.finditer(r"^[ \t]*#.*$", file_string, re.MULTILINE)]
 
-    lookup = set()
-    for fulline_comment in comment_symbols:
-        lookup.add(fulline_comment[1])
+def tokenize(file_string):
+    """
+    Split a file into (start, end, text, type) symbols in a single left to right scan.
+    Positions are those in the file with all comments removed, comments are positioned where they were removed.
+    """
+    symbols = []
+    _scan_symbols(file_string, 0, 0, symbols)
+    return symbols
+
+
+def _scan_symbols(string, pos, shift, symbols):
+    """
+    Append the symbols of string[pos:] to symbols, shifting the positions in string by shift.
+    Returns the shift reduced by the characters taken up by the comments that were scanned.
+    """
+    append = symbols.append
+    get_operator_type = operator_types.get
+    word_type = Constants.WORD_TYPE
+    for match in master_pattern.finditer(string, pos):
+        text = match.group()
+        start, end = match.span()
+        symbol_type = get_operator_type(text, word_type)
+        if symbol_type != word_type:
+            append((start + shift, end + shift, text, symbol_type))
+            if symbol_type == Constants.NOT_EQUAL_TYPE:
+                # the "=" of "!=" is an equal sign by itself as well
+                append((start + 1 + shift, end + shift, "=", Constants.EQUAL_TYPE))
+        elif text[0] == "#":
+            # a comment is a full line comment when only spaces and tabs precede it, which then belong to the comment
+            line_start = string.rfind("\n", 0, start) + 1
+            if string[line_start:start].strip(" \t"):
+                symbol_type = Constants.PART_LINE_COMMENT_TYPE
+            else:
+                symbol_type = Constants.FULL_LINE_COMMENT_TYPE
+                start = line_start
+            append((start + shift, end + shift, string[start:end], symbol_type))
+            shift -= end - start
+        else:
+            append((start + shift, end + shift, text, word_type))
+            if text[0] == '"':
+                for operator_match in operator_pattern.finditer(string, start + 1, end):
+                    _append_operator(symbols, operator_match, shift)
+    return shift
+
+
+def _append_operator(symbols, match, shift):
+    text = match.group()
+    start, end = match.span()
+    symbols.append((start + shift, end + shift, text, operator_types[text]))
+    if text == "!=":
+        # the "=" of "!=" is an equal sign by itself as well
+        symbols.append((start + 1 + shift, end + shift, "=", Constants.EQUAL_TYPE))
+
+
+def _tokenize_mapped_file(file_path):
+    """
+    Tokenize a memory mapped file, giving the same symbols tokenize gives for the decoded text of the file.
+    Returns None when the file has to be tokenized as text after all.
+    """
+    with open(file_path, "rb") as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files can't be mapped
+            return []
+    with data:
+        return _tokenize_bytes(data)
+
+
+def _tokenize_bytes(data):
+    """
+    Tokenize UTF-8 bytes, positioning the symbols by the characters of the decoded text. Operators and braces are
+    never decoded. Returns None for texts with a non ASCII word character the text tokenizer would see differently.
+    """
+    start_of_text = len(utf8_bom) if data[:len(utf8_bom)] == utf8_bom else 0
+    if start_of_text and data[start_of_text:start_of_text + 1] == b"=":
+        # the lookbehind of the equal sign would see the byte order mark
+        return None
+    # byte and character positions only drift apart after a carriage return or a multibyte character
+    has_excess = byte_excess_pattern.search(data, start_of_text) is not None
 
-    comment_symbols += [(match.start(), match.end(), match.group(), Constants.PART_LINE_COMMENT_TYPE) for match in
-                        re.finditer(r"#.*$", file_string, re.MULTILINE) if match.end() not in lookup]
-    return comment_symbols
+    symbols = []
+    append = symbols.append
+    get_operator_type = byte_operator_types.get
+    word_type = Constants.WORD_TYPE
+    shift = -start_of_text  # character position minus byte position
+    counted = start_of_text  # bytes up to here are accounted for in shift
+    for match in byte_master_pattern.finditer(data, start_of_text):
+        start, end = match.span()
+        if has_excess:
+            for excess in byte_excess_pattern.finditer(data, counted, start):
+                shift -= excess.end() - excess.start()
+            counted = start
+
+        text = match.group()
+        symbol_type = get_operator_type(text, word_type)
+        if symbol_type != word_type:
+            append((start + shift, end + shift, operator_texts[symbol_type], symbol_type))
+            if symbol_type == Constants.NOT_EQUAL_TYPE:
+                append((start + 1 + shift, end + shift, "=", Constants.EQUAL_TYPE))
+            continue
+
+        if text[0] == 35:  # "#"
+            line_start = max(data.rfind(b"\n", start_of_text, start) + 1, start_of_text)
+            line_start = data.rfind(b"\r", line_start, start) + 1 or line_start
+            if data[line_start:start].strip(b" \t"):
+                symbol_type = Constants.PART_LINE_COMMENT_TYPE
+            else:
+                symbol_type = Constants.FULL_LINE_COMMENT_TYPE
+                start = line_start
+            text = data[start:end].decode()
+            append((start + shift, start + shift + len(text), text, symbol_type))
+            shift -= len(text)
+        elif text[0] != 34:  # '"'
+            text = text.decode()
+            if has_excess and not text.isascii() and not text_word_pattern.fullmatch(text):
+                return None
+            append((start + shift, start + shift + len(text), text, word_type))
+        else:
+            text = text.decode()
+            append((start + shift, start + shift + len(text), text, word_type))
+            for operator_match in byte_operator_pattern.finditer(data, start + 1, end):
+                operator_start, operator_end = operator_match.span()
+                if has_excess:
+                    for excess in byte_excess_pattern.finditer(data, counted, operator_start):
+                        shift -= excess.end() - excess.start()
+                    counted = operator_start
+
+                symbol_type = byte_operator_types[operator_match.group()]
+                append((operator_start + shift, operator_end + shift, operator_texts[symbol_type], symbol_type))
+                if symbol_type == Constants.NOT_EQUAL_TYPE:
+                    append((operator_start + 1 + shift, operator_end + shift, "=", Constants.EQUAL_TYPE))
+    return symbols
 
 
 if __name__ == '__main__':
@@ -0,0 +1,148 @@
+import os
+import time
+import tracemalloc
+from victoria_script_parses import parser
+from victoria_script_reconstructor import reconstruct, reconstruct_to
+import iterative_reconstructor
+
+ASSIGNMENT = "building_{index} = {{ level = {index} }} # comment\n"
+# the formatter's default config, see config/general.yml
+CONFIG = {"default_no_double_line": False, "default_yes_double_line": False, "object_yes_double_line": True,
+          "force_single_line_until_item_count": 0, "force_multi_line_from_item_count": 10000000}
+
+
+def synthetic_file(assignments):
+    return "".join(ASSIGNMENT.format(index=index) for index in range(assignments))
+
+
+def time_parse(text, repeats=1):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parser.parse(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(start_assignments=12500, doublings=4):
+    """
+    Time parser.parse on a flat synthetic file that doubles in top level assignments every step, up to 100k by
+    default. Linear list reductions keep the ratio to the previous step close to 2.
+    """
+    print(f"{'assignments':>12} {'bytes':>12} {'seconds':>10} {'ratio':>7}")
+    previous = None
+    assignments = start_assignments
+    for _ in range(doublings):
+        text = synthetic_file(assignments)
+        seconds = time_parse(text)
+        ratio = f"{seconds / previous:.2f}" if previous else "-"
+        print(f"{assignments:>12} {len(text):>12} {seconds:>10.4f} {ratio:>7}")
+        previous = seconds
+        assignments *= 2
+
+
+def nested_file(assignments, depth=8):
+    """
+    The synthetic file with every assignment wrapped in depth objects.
+    """
+    opening = "".join(f"scope_{level} = {{\n" for level in range(depth))
+    closing = "}\n" * depth
+    return "".join(opening + ASSIGNMENT.format(index=index) + closing for index in range(assignments))
+
+
+def time_reconstruct(parsed, to_file, repeats=1):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if to_file:
+            with open(os.devnull, "w") as file:
+                reconstruct_to(file, parsed, CONFIG)
+        else:
+            reconstruct(parsed, CONFIG)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_reconstruct_memory(parsed, to_file):
+    tracemalloc.start()
+    try:
+        if to_file:
+            with open(os.devnull, "w") as file:
+                reconstruct_to(file, parsed, CONFIG)
+        else:
+            reconstruct(parsed, CONFIG)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_reconstruct(start_assignments=2500, doublings=4):
+    """
+    Time reconstruct into a string and reconstruct_to a file on flat and nested synthetic files that double every
+    step. Both should stay close to a ratio of 2, writing to a file with a peak memory that doesn't grow with the
+    file.
+    """
+    for name, make_file in (("flat", synthetic_file), ("nested", nested_file)):
+        print(f"{name:>8} {'assignments':>12} {'string s':>10} {'ratio':>7} {'file s':>10} {'ratio':>7} "
+              f"{'string peak':>12} {'file peak':>12}")
+        previous = None
+        assignments = start_assignments
+        for _ in range(doublings):
+            parsed = parser.parse(make_file(assignments))
+            seconds = (time_reconstruct(parsed, False), time_reconstruct(parsed, True))
+            ratios = [f"{now / before:.2f}" for now, before in zip(seconds, previous)] if previous else ["-", "-"]
+            peaks = peak_reconstruct_memory(parsed, False), peak_reconstruct_memory(parsed, True)
+            print(f"{'':>8} {assignments:>12} {seconds[0]:>10.4f} {ratios[0]:>7} {seconds[1]:>10.4f} {ratios[1]:>7} "
+                  f"{peaks[0]:>12} {peaks[1]:>12}")
+            previous = seconds
+            assignments *= 2
+
+
+def deep_file(depth, width=3):
+    """
+    One chain of depth nested objects, every level with width plain assignments and a comment around the next one.
+    """
+    level_body = "".join(f"key_{index} = value_{index}\n" for index in range(width))
+    opening = "".join(f"{level_body}# level {level}\nscope_{level} = {{\n" for level in range(depth))
+    return opening + level_body + "}\n" * depth
+
+
+def time_engine(engine, parsed, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        try:
+            engine(parsed, CONFIG)
+        except RecursionError:
+            return None
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_engines():
+    """
+    Time the recursive and the iterative reconstruction on deep chains of objects and on the wide nested file, the
+    recursive one stops at the recursion limit.
+    """
+    print(f"{'input':>24} {'recursive s':>12} {'iterative s':>12} {'speedup':>8}")
+    inputs = [(f"deep {depth}", deep_file(depth)) for depth in (50, 200, 800, 3200)]
+    inputs.append(("nested 8 x 5000", nested_file(5000)))
+    for name, text in inputs:
+        parsed = parser.parse(text)
+        recursive = time_engine(reconstruct, parsed)
+        iterative = time_engine(iterative_reconstructor.reconstruct, parsed)
+        if recursive is None:
+            print(f"{name:>24} {'RecursionError':>12} {iterative:>12.4f} {'-':>8}")
+        else:
+            print(f"{name:>24} {recursive:>12.4f} {iterative:>12.4f} {recursive / iterative:>8.2f}")
+
+
+if __name__ == '__main__':
+    import sys
+
+    if sys.argv[1:] == ["reconstruct"]:
+        run_reconstruct()
+    elif sys.argv[1:] == ["engines"]:
+        run_engines()
+    else:
+        run()
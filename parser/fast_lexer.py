@@ -0,0 +1,177 @@
+import re
+from collections import namedtuple
+
+from ply import lex
+import victoria_script_parses as grammar
+
+LexError = namedtuple('LexError', ['lexpos', 'lineno', 'character'])
+
+# The token rules of victoria_script_parses in one regular expression. The PLY master regex tries them in the order
+# they're defined, the function rules before the string rules, and takes the first one matching. Rules starting with
+# different characters never compete, so only the order among those that can share a first character is kept: the
+# special and color words before BASIC_WORD. The single character tokens go first, and the color word tries its
+# names as one alternation without the nesting. Blanks are never an error, else the last ones of the input would be,
+# with the prefix giving them back when nothing else matches.
+TOKEN_PATTERN = re.compile(r"""[ \t]*(?:
+    (?P<NEW_LINE>\n)
+  | (?P<BEGIN_DICT>\{)
+  | (?P<END_DICT>\})
+  | (?P<DIVIDER>[!<>\?=]+)
+  | (?P<COMMENT>\#.*)
+  | (?P<SPECIAL_WORD>\@\[.*?\])
+  | (?P<SPECIAL_WORD_2>"[^\n]+")
+  | (?P<COLOR_WORD>(?:rgb|hsv(?:360)?)\s*\{\s*\d+(?:\.\d+)*\s+\d+(?:\.\d+)*\s+\d+(?:\.\d+)*\s*\})
+  | (?P<BASIC_WORD>[\@\'\[\];\*\$:\w\.\/\"\|\(\)-]+)
+  | (?P<error>[^ \t])
+)""", re.VERBOSE)
+
+TOKEN_TYPES = {"SPECIAL_WORD": "BASIC_WORD", "SPECIAL_WORD_2": "BASIC_WORD", "COLOR_WORD": "BASIC_WORD"}
+
+
+class Token:
+    """
+    lex.LexToken with slots, lexer is only set by the parser on error.
+    """
+    __slots__ = ("type", "value", "lineno", "lexpos", "lexer")
+
+    def __init__(self, type, value, lineno, lexpos):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    def __repr__(self):
+        return f'LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})'
+
+
+def tokenize(data, lexpos=0, lineno=1, errors=None):
+    """
+    Yield the tokens the victoria_script_parses lexer gives for data from lexpos on. An illegal character is skipped
+    and added to errors as a LexError, where the PLY lexer's t_error prints it.
+    """
+    token_types = {name: TOKEN_TYPES.get(name, name) for name in TOKEN_PATTERN.groupindex}
+    for match in TOKEN_PATTERN.finditer(data, lexpos):
+        kind = match.lastgroup
+        if kind == "NEW_LINE":
+            yield Token("NEW_LINE", "\n", lineno, match.end() - 1)
+            lineno += 1
+        elif kind == "error":
+            if errors is not None:
+                errors.append(LexError(match.start(kind), lineno, match.group(kind)))
+        else:
+            yield Token(token_types[kind], match.group(kind), lineno, match.start(kind))
+
+
+class FastLexer:
+    """
+    Lexer with the interface of the PLY lexer the parsers use: input, token, clone, lineno and lexpos. Tokens come
+    from one regular expression scan instead of a rule by rule search per token. lexpos and lineno can be set after
+    input to start somewhere else, while lexing they keep their starting values, errors collects the illegal
+    characters of the current input.
+    """
+
+    def __init__(self):
+        self.lexdata = ""
+        self.lexpos = 0
+        self.lineno = 1
+        self.lexstate = "INITIAL"
+        self.errors = []
+        self._tokens = None
+
+    def input(self, data):
+        self.lexdata = data
+        self.lexpos = 0
+        self.errors = []
+        self._tokens = None
+
+    def token(self):
+        if self._tokens is None:
+            self._tokens = tokenize(self.lexdata, self.lexpos, self.lineno, self.errors)
+        return next(self._tokens, None)
+
+    def clone(self):
+        lexer = FastLexer()
+        lexer.lineno = self.lineno
+        return lexer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = self.token()
+        if token is None:
+            raise StopIteration
+        return token
+
+
+lexer = FastLexer()
+
+
+def install():
+    """
+    Make the fast lexer the one parser.parse uses without a lexer argument, for both the PLY and the recursive
+    descent parser.
+    """
+    lex.lexer, lex.token, lex.input = lexer, lexer.token, lexer.input
+
+
+def compare_throughput(folder_path, repeats=3):
+    """
+    Lex every .txt file of a folder with the PLY lexer and the fast lexer, check they give the same tokens and the
+    same illegal characters, the ones the PLY lexer's t_error prints, and report tokens per second of both.
+    """
+    import ast
+    import contextlib
+    import io
+    import os
+    import time
+
+    contents = []
+    for root, _, file_names in os.walk(folder_path):
+        for file_name in file_names:
+            if file_name.endswith('.txt'):
+                with open(os.path.join(root, file_name), 'r', encoding='utf-8-sig') as file:
+                    contents.append((os.path.join(root, file_name), file.read()))
+
+    def printed_errors(printed):
+        # t_error prints the character's repr and then the line number
+        lines = printed.splitlines()
+        return [(ast.literal_eval(line[len("Illegal character "):]), int(lines[index + 1]))
+                for index, line in enumerate(lines) if line.startswith("Illegal character ")]
+
+    def lex_all(make_lexer):
+        best = float("inf")
+        for _ in range(repeats):
+            results = []
+            start = time.perf_counter()
+            for _, content in contents:
+                current = make_lexer()
+                current.lineno = 1
+                with contextlib.redirect_stdout(io.StringIO()) as printed:
+                    current.input(content)
+                    tokens = [(token.type, token.value, token.lineno, token.lexpos) for token in iter(current.token, None)]
+                errors = getattr(current, "errors", None)
+                errors = printed_errors(printed.getvalue()) if errors is None else [
+                    (error.character, error.lineno) for error in errors]
+                results.append((tokens, errors))
+            best = min(best, time.perf_counter() - start)
+        return results, best
+
+    ply_results, ply_seconds = lex_all(grammar.lexer.clone)
+    fast_results, fast_seconds = lex_all(FastLexer)
+
+    mismatches = [path for (path, _), expected, found in zip(contents, ply_results, fast_results) if expected != found]
+    count = sum(len(tokens) for tokens, _ in ply_results)
+    print(f"{len(contents)} files, {count} tokens, {sum(len(errors) for _, errors in ply_results)} illegal characters, "
+          f"{len(mismatches)} mismatches")
+    for path in mismatches:
+        print("MISMATCH", path)
+    print(f"ply lexer:  {count / ply_seconds:12.0f} tokens/s")
+    print(f"fast lexer: {count / fast_seconds:12.0f} tokens/s")
+    return mismatches
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(1 if compare_throughput(sys.argv[1]) else 0)
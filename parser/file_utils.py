@@ -0,0 +1,18 @@
+import os
+
+
+def atomic_write(path, data):
+    """
+    Write data, bytes or text (stored as UTF-8), to path through a temporary file next to it that then replaces path,
+    so a reader, another process included, sees either the old file or the whole new one, never part of it. The
+    folder of path is created when missing.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
@@ -1,34 +1,106 @@
 import argparse
+import contextlib
+import csv
+import functools
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import tracemalloc
 import warnings
 from pathlib import Path
 import yaml
+from ply import lex
 
 context_size = 100
+# Columns of the per file timings test_all_txt_files writes
+TIMING_FIELDS = ["file", "bytes", "tokens", "lex_seconds", "parse_seconds", "reconstruct_seconds", "verify_seconds",
+                 "total_seconds", "bytes_per_second", "tokens_per_second", "peak_memory"]
+NON_WHITESPACE = re.compile(r"\S+")
+# Characters of a text taken at a time when comparing it without whitespace
+BLOCK_SIZE = 64 * 1024
+
+
+def _blocks(text):
+    """
+    (start, the block's text without whitespace) for the blocks of BLOCK_SIZE characters text is read in.
+    """
+    for start in range(0, len(text), BLOCK_SIZE):
+        yield start, "".join(text[start:start + BLOCK_SIZE].split())
+
+
+def _position(text, start, count):
+    """
+    Position in text of the non whitespace character count characters on from start, not counting whitespace.
+    """
+    for match in NON_WHITESPACE.finditer(text, start):
+        length = match.end() - match.start()
+        if count < length:
+            return match.start() + count
+        count -= length
+    return len(text)
+
+
+def first_difference(original_text, reconstructed_text):
+    """
+    Positions in both texts of the first character where they differ leaving whitespace out, or None when they
+    don't. Both are read a block at a time without whitespace and compared as far as both blocks go, so there's
+    never more than a block of either without whitespace.
+    """
+    original_blocks = _blocks(original_text)
+    reconstructed_blocks = _blocks(reconstructed_text)
+    # the current block of both texts, where it starts and how much of it is compared
+    original_start, original, original_used = 0, "", 0
+    reconstructed_start, reconstructed, reconstructed_used = 0, "", 0
+    while True:
+        while original is not None and original_used == len(original):
+            original_start, original = next(original_blocks, (len(original_text), None))
+            original_used = 0
+        while reconstructed is not None and reconstructed_used == len(reconstructed):
+            reconstructed_start, reconstructed = next(reconstructed_blocks, (len(reconstructed_text), None))
+            reconstructed_used = 0
+        if original is None or reconstructed is None:
+            if original is None and reconstructed is None:
+                return None
+            # one ended before the other
+            offset = 0
+            break
+
+        length = min(len(original) - original_used, len(reconstructed) - reconstructed_used)
+        original_part = original[original_used:original_used + length]
+        reconstructed_part = reconstructed[reconstructed_used:reconstructed_used + length]
+        if original_part != reconstructed_part:
+            offset = len(os.path.commonprefix((original_part, reconstructed_part)))
+            break
+        original_used += length
+        reconstructed_used += length
+
+    return (_position(original_text, original_start, original_used + offset),
+            _position(reconstructed_text, reconstructed_start, reconstructed_used + offset))
+
+
+def line_context(text, position):
+    """
+    "line L, column C: " followed by up to context_size characters of the line around position.
+    """
+    line_start = text.rfind("\n", 0, position) + 1
+    line_end = text.find("\n", position)
+    line_end = len(text) if line_end == -1 else line_end
+    start = max(line_start, position - int(context_size / 2))
+    line_number = text.count("\n", 0, position) + 1
+    return f"line {line_number}, column {position - line_start + 1}: {text[start:min(line_end, start + context_size)]}"
 
 
 def test_text_reconstruction(original_text, reconstructed_text):
-    # Remove all whitespaces for comparison
-    original_text_no_whitespace = ''.join(original_text.split())
-    reconstructed_text_no_whitespace = ''.join(reconstructed_text.split())
-
-    # Check if the texts are the same
-    if original_text_no_whitespace != reconstructed_text_no_whitespace:
-        # Find the position of the first difference
-        for i, (orig_char, recon_char) in enumerate(
-                zip(original_text_no_whitespace, reconstructed_text_no_whitespace)):
-            if orig_char != recon_char:
-                # Calculate the starting position for the 50 character context
-                start = max(0, i - int(context_size / 2))
-                # Extract the context from the original text
-                context = original_text_no_whitespace[start:start + context_size]
-                context_vs = reconstructed_text_no_whitespace[start:start + context_size]
-
-                warnings.warn(f'\n{context}\nVS\n{context_vs}', UserWarning)
-                # raise
-                return False
-        # In case the reconstructed text is shorter than the original
-        context = original_text[-context_size:]
-        warnings.warn(context, UserWarning)
+    # Compare without whitespace
+    difference = first_difference(original_text, reconstructed_text)
+    if difference is not None:
+        original_position, reconstructed_position = difference
+        warnings.warn(f'\n{line_context(original_text, original_position)}\nVS\n'
+                      f'{line_context(reconstructed_text, reconstructed_position)}', UserWarning)
         return False
     return True
 
@@ -37,17 +109,81 @@ def test_parsing_consistency(original_parsed_data, reconstructed_parsed_data):
     return original_parsed_data == reconstructed_parsed_data
 
 
-def test_file(file_path, parser_func, reconstruct_func, config):
+def count_tokens(content):
+    lexer = lex.lexer.clone()
+    lexer.lineno = 1
+    lexer.input(content)
+    # the PLY lexer prints illegal characters, which parsing prints already
+    with contextlib.redirect_stdout(io.StringIO()):
+        return sum(1 for _ in iter(lexer.token, None))
+
+
+def test_file(file_path, parser_func, reconstruct_func, config, timings=None):
+    """
+    Whether reconstructing a file keeps its text and its parse. With a timings dict the seconds every step took go in
+    it, lexing once more on its own to count the tokens.
+    """
     # Read the content
     with open(file_path, 'r', encoding='utf-8-sig') as file:
         content = file.read()
 
+    if timings is not None:
+        start = time.perf_counter()
+        timings["tokens"] = count_tokens(content)
+        timings["lex_seconds"] = time.perf_counter() - start
+
+    # line numbers start over for every file, also when a worker process handles files in another order
+    lex.lexer.lineno = 1
+    start = time.perf_counter()
     parsed_data = parser_func.parse(content)
+    parsed = time.perf_counter()
     reconstructed_text = reconstruct_func(parsed_data, config)
+    reconstructed = time.perf_counter()
     reconstructed_parsed_data = parser_func.parse(reconstructed_text)
-
-    return test_text_reconstruction(content, reconstructed_text), test_parsing_consistency(parsed_data,
-                                                                                           reconstructed_parsed_data)
+    result = test_text_reconstruction(content, reconstructed_text), test_parsing_consistency(parsed_data,
+                                                                                             reconstructed_parsed_data)
+    if timings is not None:
+        timings["parse_seconds"] = parsed - start
+        timings["reconstruct_seconds"] = reconstructed - parsed
+        timings["verify_seconds"] = time.perf_counter() - reconstructed
+    return result
+
+
+def profile_file(file_path, parser_func, reconstruct_func, config):
+    """
+    test_file with its timings, the throughput and the peak memory of testing the file, which is tested a second time
+    for it, since tracing allocations slows everything down.
+    """
+    timings = {"file": file_path, "bytes": os.path.getsize(file_path)}
+    result = test_file(file_path, parser_func, reconstruct_func, config, timings)
+
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        tracemalloc.start()
+        try:
+            test_file(file_path, parser_func, reconstruct_func, config)
+        finally:
+            timings["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    timings["total_seconds"] = timings["parse_seconds"] + timings["reconstruct_seconds"] + timings["verify_seconds"]
+    timings["bytes_per_second"] = timings["bytes"] / timings["total_seconds"] if timings["total_seconds"] else 0
+    timings["tokens_per_second"] = timings["tokens"] / timings["parse_seconds"] if timings["parse_seconds"] else 0
+    return result + (timings,)
+
+
+def write_timings(file_path, timings):
+    """
+    Per file timings as a list of objects in JSON, or as CSV when file_path ends with .csv.
+    """
+    timings = [{field: file_timings[field] for field in TIMING_FIELDS} for file_timings in timings]
+    with open(file_path, 'w', encoding='utf-8', newline='') as file:
+        if file_path.endswith('.csv'):
+            writer = csv.DictWriter(file, fieldnames=TIMING_FIELDS)
+            writer.writeheader()
+            writer.writerows(timings)
+        else:
+            json.dump(timings, file, indent=1)
 
 
 class Mutex:
@@ -139,6 +275,26 @@ def parse_args():
     parser.add_argument('--force_multi_line_from_item_count', type=int, help='Force multi line from item count')
     parser.add_argument('--format_folder', type=str, help='Format folder')
     parser.add_argument("--format_files", nargs='*', type=str, help="Format files")
+    parser.add_argument('--parser_backend', type=str, choices=["ply", "recursive_descent"], default="ply",
+                        help='Parser to read the files with, both give the same result')
+    parser.add_argument('--lexer', type=str, choices=["ply", "fast"], default="ply",
+                        help='Lexer to read the files with, fast collects illegal characters instead of printing them')
+    parser.add_argument('--reconstructor', type=str, choices=["recursive", "iterative"], default="recursive",
+                        help='Reconstruction to format with, both give the same result, iterative has no depth limit')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes to format the files with')
+    parser.add_argument('--reconstruction_cache', type=str, help='File to keep reconstructed top level blocks in '
+                                                                 'between runs, parser/.cache by default')
+    parser.add_argument('--no_reconstruction_cache', action='store_true',
+                        help='Reconstruct every block instead of reusing those of earlier runs')
+    parser.add_argument('--force', action='store_true',
+                        help='Format every file, also those unchanged since the last run with the same config')
+    parser.add_argument('--check', action='store_true',
+                        help='Write nothing, list the files formatting would change and fail if there are any')
+    parser.add_argument('--test', action='store_true',
+                        help='Test that formatting keeps the text and parse of every file instead of formatting them')
+    parser.add_argument('--timings', type=str,
+                        help='With --test, file to write the timings of every file to, .json or .csv')
+    parser.add_argument('--slowest', type=int, default=10, help='Number of slowest files --timings reports')
 
     mutex_1 = Mutex(["default_no_double_line", "default_yes_double_line"], True, bool)
     mutex_3 = Mutex(["object_yes_double_line"], True, bool)
@@ -150,37 +306,61 @@ def parse_args():
     return parser.parse_args(), mutexes
 
 
-def test_all_txt_files(folder_path, parser_func, reconstruct_func, config={}):
+def test_file_result(file_path, parser_func, reconstruct_func, config, profile=False):
+    try:
+        if profile:
+            return profile_file(file_path, parser_func, reconstruct_func, config)
+        return test_file(file_path, parser_func, reconstruct_func, config)
+    except TypeError:
+        return (False, False, None) if profile else (False, False)
+
+
+def test_all_txt_files(folder_path, parser_func, reconstruct_func, config={}, jobs=1, timings_path=None, slowest=10):
+    """
+    Test every .txt file of a folder and report the pass rates and the failed files. With timings_path the timings
+    of every file are written to it and the report has the slowest ones.
+    """
+    profile = timings_path is not None
+    timings = []
     total_files = 0
     passed_reconstruction = 0
     passed_consistency = 0
     failed_files = []
 
+    # (file name, file path or None when it's too small to test)
+    entries = []
     for root, dirs, files in os.walk(folder_path):
         for file_name in files:
             if file_name.endswith('.txt'):
-                print(file_name)
                 file_path = os.path.join(root, file_name)
-                if os.path.getsize(file_path) <= 3:
-                    continue
-
-                total_files += 1
-
-                print("Testing", file_path)
-                try:
-                    reconstruction_bool, consistency_bool = test_file(file_path, parser_func, reconstruct_func, config)
-                except TypeError:
-                    reconstruction_bool = False
-                    consistency_bool = False
-                # Track passed tests
-                if reconstruction_bool:
-                    passed_reconstruction += 1
-                if consistency_bool:
-                    passed_consistency += 1
-
-                # Track failed files
-                if not reconstruction_bool:
-                    failed_files.append(file_path)
+                entries.append((file_name, file_path if os.path.getsize(file_path) > 3 else None))
+
+    function = functools.partial(test_file_result, profile=True) if profile else test_file_result
+    results = run_jobs(function, [file_path for _, file_path in entries if file_path],
+                       parser_func, reconstruct_func, config, jobs)
+    for file_name, file_path in entries:
+        print(file_name)
+        if file_path is None:
+            continue
+
+        total_files += 1
+
+        print("Testing", file_path)
+        if profile:
+            reconstruction_bool, consistency_bool, file_timings = next(results)
+            if file_timings is not None:
+                timings.append(file_timings)
+        else:
+            reconstruction_bool, consistency_bool = next(results)
+        # Track passed tests
+        if reconstruction_bool:
+            passed_reconstruction += 1
+        if consistency_bool:
+            passed_consistency += 1
+
+        # Track failed files
+        if not reconstruction_bool:
+            failed_files.append(file_path)
 
     # Calculate percentages
     reconstruction_percentage = (passed_reconstruction / total_files) * 100 if total_files > 0 else 0
@@ -192,23 +372,51 @@ def test_all_txt_files(folder_path, parser_func, reconstruct_func, config={}):
         'Parsing Consistency Test Pass Rate': consistency_percentage,
         'Failed Files': failed_files
     }
+    if profile:
+        write_timings(timings_path, timings)
+        timings.sort(key=lambda file_timings: file_timings["total_seconds"], reverse=True)
+        report['Slowest Files'] = [(file_timings["file"], round(file_timings["total_seconds"], 4))
+                                   for file_timings in timings[:slowest]]
 
     return report
 
 
-def process_file(file_path, parser_func, reconstruct_func, reconstruct_config):
+def formatted_bytes(text):
+    """
+    What process_file writes for text: utf-8 with a byte order mark and the platform's line ends.
+    """
+    return text.replace("\n", os.linesep).encode('utf-8-sig')
+
+
+def process_file(file_path, parser_func, reconstruct_func, reconstruct_config, write=True):
+    """
+    Format a file, which is only written when the formatted text is different from what's in it, or never without
+    write. Returns (valid, changed): whether the reconstruction was valid and whether it differs from the file.
+    """
     # Read the content
-    with open(file_path, 'r', encoding='utf-8-sig') as file:
-        content = file.read()
+    with open(file_path, 'rb') as file:
+        original = file.read()
+    content = io.TextIOWrapper(io.BytesIO(original), encoding='utf-8-sig').read()
 
+    lex.lexer.lineno = 1
     original_parsed_data = parser_func.parse(content)
+    lex_errors = getattr(lex.lexer, "errors", None)
+    if lex_errors:
+        print(f"{len(lex_errors)} illegal characters in {file_path}, the first {lex_errors[0].character!r} "
+              f"on line {lex_errors[0].lineno}")
     reconstructed_text = reconstruct_func(original_parsed_data, reconstruct_config)
 
     if test_text_reconstruction(content, reconstructed_text):
-        with open(file_path, 'w', encoding='utf-8-sig') as file:
-            file.write(reconstructed_text)
+        output = formatted_bytes(reconstructed_text)
+        if output == original:
+            return True, False
+        if write:
+            with open(file_path, 'wb') as file:
+                file.write(output)
+        return True, True
     else:
         print(f"ERROR {file_path} couldn't be reconstructed")
+        return False, False
 
 
 def is_excluded(file_path, exclusion_list):
@@ -219,25 +427,120 @@ def is_excluded(file_path, exclusion_list):
     return False
 
 
-def process_all_txt_files(folder_path, parser_func, reconstruct_func, exclusion_list, reconstruct_config):
+def process_all_txt_files(folder_path, parser_func, reconstruct_func, exclusion_list, reconstruct_config, jobs=1,
+                          manifest=None, write=True):
+    """
+    Format every .txt file of a folder that isn't excluded and return the paths of those that changed, or would
+    change when not writing. With a FormatManifest the files it has as formatted already are skipped before they're
+    read, and the ones formatted now are added to it.
+    """
+    # (file path, excluded, unchanged)
+    entries = []
     for root, dirs, files in os.walk(folder_path):
         dirs[:] = [d for d in dirs if not is_excluded(os.path.join(root, d), exclusion_list)]
         for file_name in files:
             if file_name.endswith('.txt'):
                 file_path = os.path.join(root, file_name)
-                if not is_excluded(file_path, exclusion_list):
-                    print(f"Processing {file_path}:")
-                    process_file(file_path, parser_func, reconstruct_func, reconstruct_config)
+                excluded = is_excluded(file_path, exclusion_list)
+                unchanged = not excluded and manifest is not None and manifest.is_unchanged(file_path)
+                entries.append((file_path, excluded, unchanged))
+
+    function = process_file if write else functools.partial(process_file, write=False)
+    results = run_jobs(function, [file_path for file_path, excluded, unchanged in entries
+                                  if not excluded and not unchanged],
+                       parser_func, reconstruct_func, reconstruct_config, jobs)
+    changed_files = []
+    for file_path, excluded, unchanged in entries:
+        if excluded:
+            print(f"Excluded {file_path}")
+        elif unchanged:
+            print(f"Unchanged {file_path}")
+        else:
+            print(f"Processing {file_path}:")
+            valid, changed = next(results)
+            if changed:
+                changed_files.append(file_path)
+            if manifest is not None:
+                if valid and (write or not changed):
+                    manifest.record(file_path)
                 else:
-                    print(f"Excluded {file_path}")
+                    manifest.forget(file_path)
+    return changed_files
+
+
+def reconstruction_cache_of(reconstruct_func):
+    """
+    The ReconstructionCache a reconstruct function was bound to with functools.partial, if any.
+    """
+    return getattr(reconstruct_func, "keywords", {}).get("cache")
+
+
+_job = None
+
+
+def _init_job_worker(function, parser_func, reconstruct_func, config, lexer, cache_settings):
+    global _job
+    if cache_settings is not None:
+        from reconstruction_cache import ReconstructionCache
+        # a cache of the worker's own, what it adds goes back to the main process through take_new
+        reconstruct_func = functools.partial(reconstruct_func, cache=ReconstructionCache(*cache_settings))
+    _job = function, parser_func, reconstruct_func, config
+    # the lexer parser.parse uses without a lexer argument, which may have been swapped for the fast one
+    lex.lexer, lex.token, lex.input = lexer, lexer.token, lexer.input
+
+
+def _run_job(file_path):
+    function, parser_func, reconstruct_func, config = _job
+    with contextlib.redirect_stdout(io.StringIO()) as output, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        result = function(file_path, parser_func, reconstruct_func, config)
+    cache = reconstruction_cache_of(reconstruct_func)
+    return (result, output.getvalue(), [(w.message, w.category, w.filename, w.lineno) for w in caught],
+            cache.take_new() if cache is not None else None)
+
+
+def run_jobs(function, file_paths, parser_func, reconstruct_func, config, jobs=1):
+    """
+    Yield function(file_path, parser_func, reconstruct_func, config) for every file path, in order. With more than
+    one job the files are handled in a pool of processes, what they print and warn is replayed here as their
+    results are taken, so the output is the same as that of a serial run.
+    """
+    if jobs <= 1:
+        for file_path in file_paths:
+            yield function(file_path, parser_func, reconstruct_func, config)
+        return
+
+    cache = reconstruction_cache_of(reconstruct_func)
+    cache_settings = None
+    if cache is not None:
+        # the workers load the stored cache themselves rather than each getting a pickled copy of this one
+        reconstruct_func = functools.partial(reconstruct_func, cache=None)
+        cache_settings = cache.path, cache.max_size
+    with multiprocessing.Pool(jobs, initializer=_init_job_worker,
+                              initargs=(function, parser_func, reconstruct_func, config, lex.lexer.clone(),
+                                        cache_settings)) as pool:
+        for result, output, caught, cache_update in pool.imap(_run_job, file_paths):
+            sys.stdout.write(output)
+            for message, category, filename, lineno in caught:
+                warnings.warn_explicit(message, category, filename, lineno)
+            if cache_update is not None:
+                cache.merge(*cache_update)
+            yield result
 
 
 if __name__ == '__main__':
-    import os
-    from victoria_script_parses import parser
-    from victoria_script_reconstructor import reconstruct
-
     args, mutexes = parse_args()
+    if args.reconstructor == "iterative":
+        from iterative_reconstructor import reconstruct
+    else:
+        from victoria_script_reconstructor import reconstruct
+    if args.parser_backend == "recursive_descent":
+        from recursive_descent import parser
+    else:
+        from victoria_script_parses import parser
+    if args.lexer == "fast":
+        import fast_lexer
+        fast_lexer.install()
     configs_yaml = load_yaml_config(args.config)
     config, exclusion_list = configs_yaml["config"], configs_yaml["exclusion_list"]
     args_dict = vars(args)
@@ -258,5 +561,32 @@ if __name__ == '__main__':
     else:
         raise ValueError("no target defined")
 
-    process_all_txt_files(target, parser, reconstruct, exclusion_list, config)
+    if args.test:
+        report = test_all_txt_files(target, parser, reconstruct, config, args.jobs, args.timings, args.slowest)
+        for key, value in report.items():
+            print(f"{key}: {value}")
+        sys.exit(0 if not report['Failed Files'] else 1)
+
+    cache = None
+    if not args.no_reconstruction_cache:
+        from reconstruction_cache import ReconstructionCache, DEFAULT_PATH
+        cache = ReconstructionCache(args.reconstruction_cache or DEFAULT_PATH)
+        reconstruct = functools.partial(reconstruct, cache=cache)
+
+    from format_manifest import FormatManifest
+    manifest = FormatManifest(target, config, force=args.force)
+
+    changed_files = process_all_txt_files(target, parser, reconstruct, exclusion_list, config, args.jobs, manifest,
+                                          write=not args.check)
+    manifest.save()
+
+    if cache is not None:
+        print(cache.report())
+        cache.save()
+
+    if args.check:
+        for file_path in changed_files:
+            print(f"Would reformat {file_path}")
+        print(f"{len(changed_files)} files would be reformatted")
+        sys.exit(1 if changed_files else 0)
 
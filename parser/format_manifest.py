@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+
+from file_utils import atomic_write
+from reconstruction_cache import CACHE_FOLDER, CONFIG_KEYS, reconstructor_signature
+
+# Bump whenever the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+
+def config_hash(config):
+    """
+    Hash of what formatting depends on besides the file: the config values reconstruction reads and the source of
+    the reconstruction engines.
+    """
+    values = [MANIFEST_VERSION, reconstructor_signature()] + [config.get(key) for key in CONFIG_KEYS]
+    return hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest()[:16]
+
+
+def content_hash(file_path):
+    with open(file_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def manifest_path(target):
+    name = hashlib.sha256(os.path.abspath(str(target)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_FOLDER, f"format_manifest-{name}.json")
+
+
+class FormatManifest:
+    """
+    Content hash, size and modification time of every file as the formatter last left it, for one target folder and
+    config. A file whose size and modification time, or else content hash, are still those is already formatted and
+    doesn't need to be read again. With force nothing counts as unchanged, the manifest is still brought up to date.
+    """
+
+    def __init__(self, target, config, force=False, path=None):
+        self.path = path if path is not None else manifest_path(target)
+        self.config_hash = config_hash(config)
+        self.force = force
+        self.files = {}
+        self.seen = set()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            return
+        if stored.get("config_hash") == self.config_hash:
+            self.files = stored.get("files", {})
+
+    def is_unchanged(self, file_path):
+        key = os.path.abspath(file_path)
+        self.seen.add(key)
+        entry = self.files.get(key)
+        if self.force or entry is None:
+            return False
+        stat = os.stat(file_path)
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        if entry["size"] == stat.st_size and entry["sha256"] == content_hash(file_path):
+            # touched but not changed, remember the new time to skip the hashing next time
+            entry["mtime_ns"] = stat.st_mtime_ns
+            return True
+        return False
+
+    def record(self, file_path):
+        """
+        Remember the file as it is now, after it was formatted.
+        """
+        key = os.path.abspath(file_path)
+        self.seen.add(key)
+        stat = os.stat(file_path)
+        self.files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": content_hash(file_path)}
+
+    def forget(self, file_path):
+        self.files.pop(os.path.abspath(file_path), None)
+
+    def save(self):
+        """
+        Store the manifest, without the files that weren't part of this run anymore.
+        """
+        files = {key: entry for key, entry in self.files.items() if key in self.seen}
+        atomic_write(self.path, json.dumps({"config_hash": self.config_hash, "files": files}, indent=1, sort_keys=True))
@@ -0,0 +1,197 @@
+from bisect import bisect_left
+
+import victoria_script_parses
+from parse_nodes import Node, ListNode
+from recursive_descent import parser as recursive_descent_parser
+
+
+def apply_edit(text, offset, removed, inserted):
+    return text[:offset] + inserted + text[offset + removed:]
+
+
+def shift_positions(node, delta, line_delta):
+    """
+    Move the lexpos and lineno of a node and everything under it, in place.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Node):
+            node.lexpos += delta
+            node.lineno += line_delta
+            for field in node.fields:
+                value = getattr(node, field)
+                if isinstance(value, (Node, list)):
+                    stack.append(value)
+        else:
+            stack.extend(node)
+
+
+def _full_parse(text, lexer):
+    lexer.lineno = 1
+    return recursive_descent_parser.parse(text, lexer=lexer)
+
+
+class IncrementalParse:
+    """
+    Parsed text that is kept up to date through edits, parsing only the top level items around each edit again.
+    Parsing starts at the item before the line of the edit, since greedy COMMENT and NEW_LINE rules let an item's end
+    depend on the token after it, and stops at the first item that starts after the edit where an item started
+    before, from there on the old and the new parse read the same text the same way. The items after an edit keep
+    their nodes, moving their lexpos and lineno is put off until the tree is read.
+    """
+
+    def __init__(self, text, tree=None, lexer=None):
+        self.lexer = lexer if lexer is not None else victoria_script_parses.lexer.clone()
+        self._reset(text, tree)
+
+    def _reset(self, text, tree=None):
+        self.text = text
+        self._error_tree = None
+        if tree is not None:
+            items = tree.items
+        else:
+            self.lexer.input(text)
+            self.lexer.lineno = 1
+            result = recursive_descent_parser.parse_items(self.lexer, lambda lexpos: False)
+            items = result[0] if result is not None else []
+            if not items:
+                # a full parse reports the syntax error, every edit parses the whole text until it's gone
+                self._error_tree = _full_parse(text, self.lexer)
+        self._items = list(items)
+        # where every top level item starts in text, and the move still to be made to its nodes
+        self._starts = [item.lexpos for item in self._items]
+        self._lexpos_shifts = [0] * len(self._items)
+        self._lineno_shifts = [0] * len(self._items)
+
+    @property
+    def syntax_error(self):
+        return not self._items
+
+    @property
+    def tree(self):
+        """
+        The parse of text, after a syntax error whatever parser.parse gives.
+        """
+        if not self._items:
+            return self._error_tree
+        for index, delta in enumerate(self._lexpos_shifts):
+            if delta or self._lineno_shifts[index]:
+                shift_positions(self._items[index], delta, self._lineno_shifts[index])
+                self._lexpos_shifts[index] = self._lineno_shifts[index] = 0
+        return ListNode(list(self._items), self._items[0].lexpos, self._items[0].lineno)
+
+    def edit(self, offset, removed, inserted):
+        """
+        Replace removed characters at offset with inserted and parse the items around it again.
+        """
+        text = self.text
+        new_text = apply_edit(text, offset, removed, inserted)
+        if not self._items:
+            self._reset(new_text)
+            return
+
+        starts = self._starts
+        line_start = text.rfind("\n", 0, offset) + 1
+        first = max(bisect_left(starts, line_start) - 1, 0)
+        start = starts[first] if first else 0
+        delta = len(inserted) - removed
+        line_delta = inserted.count("\n") - text.count("\n", offset, offset + removed)
+        edit_end = offset + len(inserted)
+
+        def stop(lexpos):
+            if lexpos < edit_end:
+                return False
+            index = bisect_left(starts, lexpos - delta, first + 1)
+            return index < len(starts) and starts[index] == lexpos - delta
+
+        lexer = self.lexer
+        lexer.input(new_text)
+        lexer.lexpos = start
+        lexer.lineno = self._items[first].lineno + self._lineno_shifts[first] - text.count("\n", start, starts[first])
+        result = recursive_descent_parser.parse_items(lexer, stop)
+        if result is None:
+            self._reset(new_text)
+            return
+        parsed, resume = result
+
+        resume_index = len(starts) if resume is None else bisect_left(starts, resume - delta, first + 1)
+        self._items[first:resume_index] = parsed
+        count = len(parsed)
+        end = first + count
+        starts[first:resume_index] = [item.lexpos for item in parsed]
+        self._lexpos_shifts[first:resume_index] = [0] * count
+        self._lineno_shifts[first:resume_index] = [0] * count
+        if delta:
+            starts[end:] = [position + delta for position in starts[end:]]
+            self._lexpos_shifts[end:] = [shift + delta for shift in self._lexpos_shifts[end:]]
+        if line_delta:
+            self._lineno_shifts[end:] = [shift + line_delta for shift in self._lineno_shifts[end:]]
+        self.text = new_text
+        if not self._items:
+            self._reset(new_text)
+
+
+def compare_with_full_parse(edits=100, assignments=10000, seed=0):
+    """
+    Apply random edits to a synthetic file one after another through IncrementalParse, and check every tree and the
+    positions in it against a full parse, timing both.
+    """
+    import random
+    import statistics
+    import time
+    from benchmark_parser import synthetic_file
+
+    def spans(node):
+        found = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Node):
+                found.append((node.parse_type, node.lexpos, node.lineno))
+                stack.extend(getattr(node, field) for field in node.fields)
+            elif isinstance(node, list):
+                stack.extend(node)
+        return found
+
+    # edits that mostly keep the file valid
+    fragments = ["", "x", "\n", "\n\n", " # note\n", "\nlevel = 3\n", "\na = { b = c }\n", " yes ", " "]
+    random_generator = random.Random(seed)
+    document = IncrementalParse(synthetic_file(assignments))
+    mismatches = 0
+    full_times = []
+    edit_times = []
+    for _ in range(edits):
+        text = document.text
+        offset = random_generator.randrange(len(text) + 1)
+        removed = 1 if text[offset:offset + 2].isalnum() and random_generator.random() < 0.5 else 0
+        inserted = random_generator.choice(fragments)
+
+        start = time.perf_counter()
+        document.edit(offset, removed, inserted)
+        edit_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = _full_parse(document.text, victoria_script_parses.lexer.clone())
+        full_times.append(time.perf_counter() - start)
+
+        tree = document.tree
+        if tree != expected or spans(tree) != spans(expected):
+            mismatches += 1
+            print("MISMATCH", offset, removed, repr(inserted))
+        if document.syntax_error:
+            # start over from text that parses, the edit parsed the whole file
+            document = IncrementalParse(synthetic_file(assignments))
+        else:
+            edit_times.append(edit_seconds)
+
+    print(f"{edits} edits on {len(document.text)} bytes, {mismatches} mismatches")
+    print(f"full parse:  {statistics.median(full_times) * 1000:8.2f} ms per edit")
+    print(f"edit:        {statistics.median(edit_times) * 1000:8.2f} ms per edit without a syntax error")
+    return mismatches
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(1 if compare_with_full_parse() else 0)
@@ -0,0 +1,218 @@
+from parse_nodes import Node, item_count
+from victoria_script_parses import ParseTypes
+
+# A reconstruction state is a plain tuple frame in the field order of victoria_script_reconstructor.State, every
+# entry of the stack carries its own, so nothing needs copying back when an element is done.
+LEVEL, NO_NEW_LINES, AFTER_END_OF_OBJECT, AFTER_LAST_OBJECT, CURRENTLY_NO_NEWLINES_IN_LIST, ITEM_COUNT_OBJECT = range(6)
+INITIAL_STATE = (0, False, False, False, False, 10000)
+
+NEW_LINES = (ParseTypes.NEW_LINE, ParseTypes.DOUBLE_NEWLINE)
+LINE_ENDS = (ParseTypes.NEW_LINE, ParseTypes.DOUBLE_NEWLINE, ParseTypes.FULL_LINE_COMMENT)
+
+
+def _tabs(state):
+    if not state[NO_NEW_LINES]:
+        return "\t" * state[LEVEL]
+    return ""
+
+
+def _leaf(element, state, config):
+    """
+    Text of an element without children, or None for the elements that have them.
+    """
+    parse_type = element[0]
+    if parse_type == ParseTypes.ELEMENT:
+        return f"{_tabs(state)}{element[1]}"
+    if parse_type == ParseTypes.NEW_LINE:
+        if (not state[AFTER_LAST_OBJECT]
+                and (config["default_yes_double_line"]
+                     or (config["object_yes_double_line"] and state[AFTER_END_OF_OBJECT]
+                         and state[CURRENTLY_NO_NEWLINES_IN_LIST])
+                     or (config["force_multi_line_from_item_count"]
+                         and state[ITEM_COUNT_OBJECT] > config["force_multi_line_from_item_count"]
+                         and state[AFTER_END_OF_OBJECT]))):
+            return f"\n{_tabs(state)}\n"
+        return "\n"
+    if parse_type == ParseTypes.END:
+        return f"{_tabs(state)}{element[1]}"
+    if parse_type == ParseTypes.BEGIN:
+        return f"{element[1]}"
+    if parse_type == ParseTypes.DOUBLE_NEWLINE:
+        if (state[AFTER_LAST_OBJECT]
+                or (config["default_no_double_line"]
+                    and not (config["object_yes_double_line"] and state[AFTER_END_OF_OBJECT]))
+                or (config["force_single_line_until_item_count"]
+                    and state[ITEM_COUNT_OBJECT] <= config["force_single_line_until_item_count"])):
+            return "\n"
+        return f"\n{_tabs(state)}\n"
+    if parse_type == ParseTypes.FULL_LINE_COMMENT:
+        string_list = element[1].split('\n')
+        string_list[-1] = _tabs(state) + string_list[-1]
+        return "\n".join(string_list)
+    if parse_type == ParseTypes.BEGIN_COMMENT:
+        string = f"{element[1]}\t{element[2]}"
+        if state[NO_NEW_LINES]:
+            string += "\n" + "\t" * (state[LEVEL] + 1)
+        return string
+    if parse_type == ParseTypes.END_COMMENT:
+        return f"{_tabs(state)}{element[1]}\t{element[2]}"
+    return None
+
+
+def _piece(element, state, config):
+    """
+    What goes on the stack for element: its text when it has no children, else the element with its state.
+    """
+    if not isinstance(element, (tuple, Node)):
+        return ""
+    text = _leaf(element, state, config)
+    return (element, state) if text is None else text
+
+
+def _list_pieces(element, state, config):
+    final_list = element[1]
+    currently_no_newlines_in_list = True
+    if config["force_single_line_until_item_count"] is not None or config[
+        "force_multi_line_from_item_count"] is not None:
+        count, _, has_new_lines = item_count(element)
+        if has_new_lines:
+            currently_no_newlines_in_list = False
+
+    if config["force_single_line_until_item_count"] is not None and count <= config[
+        "force_single_line_until_item_count"]:
+        final_list = []
+        for e in element[1]:
+            if e[0] not in NEW_LINES:
+                final_list.append(e)
+                if e[0] == ParseTypes.FULL_LINE_COMMENT or e[0] == ParseTypes.COMMENT:
+                    final_list.append((ParseTypes.NEW_LINE, "\n"))
+
+    elif config["force_multi_line_from_item_count"] is not None and count > config["force_multi_line_from_item_count"]:
+        items = element[1]
+        final_list = [(ParseTypes.NEW_LINE, "\n"), items[0]] if state[LEVEL] > 0 and items[0][0] not in LINE_ENDS \
+            else [items[0]]
+        for i in range(1, len(items)):
+            if items[i - 1][0] not in LINE_ENDS and items[i][0] not in LINE_ENDS:
+                final_list.append((ParseTypes.NEW_LINE, "\n"))
+            final_list.append(items[i])
+        if final_list[-1][0] not in LINE_ENDS:
+            final_list.append((ParseTypes.NEW_LINE, "\n"))
+
+    if not final_list:
+        return []
+
+    level, _, after_end_of_object, after_last_object, _, item_count_object = state
+    no_new_lines = final_list[0][0] not in LINE_ENDS and level > 0
+    pieces = []
+    if no_new_lines:
+        pieces.append(" ")
+
+    last = len(final_list) - 1
+    for i, item in enumerate(final_list):
+        if item[0] == ParseTypes.ASSIGNMENT and item[3][0] == ParseTypes.OBJECT and item[3][2]:
+            count, _, _ = item_count(item[3][2])
+            item_count_object = count
+
+        pieces.append(_piece(item, (level, no_new_lines, after_end_of_object, after_last_object,
+                                    currently_no_newlines_in_list, item_count_object), config))
+        if no_new_lines:
+            pieces.append(" ")
+
+        # Objects after Objects should have a whitespace between them
+        if len(item) > 3 and item[3][0] == ParseTypes.OBJECT and last > i + 1 and len(
+                final_list[i + 2]) > 3 and final_list[i + 2][3][0] == ParseTypes.OBJECT:
+            if config["force_single_line_until_item_count"] and count <= config["force_single_line_until_item_count"]:
+                after_end_of_object = False
+            else:
+                after_end_of_object = True
+            after_last_object = i >= last - 1
+        else:
+            after_end_of_object = after_last_object = False
+    return pieces
+
+
+def _object_pieces(element, state, config):
+    level = state[LEVEL]
+    if not element[2]:  # empty
+        inline_state = (level, True) + state[AFTER_END_OF_OBJECT:]
+        return [_piece(element[1], inline_state, config), _piece(element[3], inline_state, config)]
+
+    # newline before object close
+    no_new_lines = not (element[2][1][-1][0] in NEW_LINES and level > 0)
+    comment_always_newline = False
+
+    if config["force_single_line_until_item_count"] is not None or config[
+        "force_multi_line_from_item_count"] is not None:
+        count, last_item, _ = item_count(element[2])
+
+        # anticipate single line
+        if config["force_single_line_until_item_count"] is not None and count <= config[
+            "force_single_line_until_item_count"]:
+            no_new_lines = True
+            comment_always_newline = True
+
+        # anticipate multiline
+        elif config["force_multi_line_from_item_count"] is not None and count > config[
+            "force_multi_line_from_item_count"]:
+            no_new_lines = False
+
+        # exception for comment as last element, which always needs a newline because how comments work.
+        if last_item and (last_item[0] == ParseTypes.FULL_LINE_COMMENT or last_item[0] == ParseTypes.COMMENT):
+            no_new_lines = False
+
+    rest = state[AFTER_END_OF_OBJECT:]
+    return [_piece(element[1], (level, comment_always_newline) + rest, config),
+            _piece(element[2], (level + 1, False) + rest, config),
+            _piece(element[3], (level, no_new_lines) + rest, config)]
+
+
+def _run(stack, write, config):
+    pop = stack.pop
+    while stack:
+        entry = pop()
+        if type(entry) is str:
+            if entry:
+                write(entry)
+            continue
+
+        element, state = entry
+        parse_type = element[0]
+        if parse_type == ParseTypes.LIST:
+            pieces = _list_pieces(element, state, config)
+        elif parse_type == ParseTypes.ASSIGNMENT:
+            pieces = [f"{_tabs(state)}{element[2]} {element[1]} ",
+                      _piece(element[3], (state[LEVEL], True) + state[AFTER_END_OF_OBJECT:], config)]
+        elif parse_type == ParseTypes.OBJECT:
+            pieces = _object_pieces(element, state, config)
+        else:  # COMMENT
+            pieces = [_piece(element[1], state, config), f"\t{element[2]}"]
+        stack.extend(reversed(pieces))
+
+
+def _render(element, state, config):
+    pieces = []
+    _run([(element, state)], pieces.append, config)
+    return "".join(pieces)
+
+
+def reconstruct_to(stream, parsed_data, config, cache=None):
+    """
+    victoria_script_reconstructor.reconstruct_to without recursion: the text still to write is a stack of strings and
+    (element, state) entries, an element with children is replaced by its pieces, in reverse so they pop in order.
+    Nesting only grows the stack, never the Python call depth.
+    """
+    write = stream.append if isinstance(stream, list) else stream.write
+    root = _piece(parsed_data, INITIAL_STATE, config)
+    if cache is not None and type(root) is tuple and parsed_data[0] == ParseTypes.LIST:
+        # the top level elements from the cache, the ones without children are texts already
+        stack = [piece if type(piece) is str else cache.render(*piece, config, _render)
+                 for piece in reversed(_list_pieces(parsed_data, INITIAL_STATE, config))]
+    else:
+        stack = [root]
+    _run(stack, write, config)
+
+
+def reconstruct(parsed_data, config, cache=None):
+    pieces = []
+    reconstruct_to(pieces, parsed_data, config, cache)
+    return "".join(pieces)
@@ -0,0 +1,255 @@
+from enum import IntEnum, auto
+
+
+class ParseTypes(IntEnum):
+    LIST = auto()
+    ASSIGNMENT = auto()
+    ELEMENT = auto()
+    FULL_LINE_COMMENT = auto()
+    COMMENT = auto()
+    OBJECT = auto()
+    BEGIN = auto()
+    BEGIN_COMMENT = auto()
+    END = auto()
+    END_COMMENT = auto()
+    DOUBLE_NEWLINE = auto()
+    NEW_LINE = auto()
+
+
+class Node:
+    """
+    Node of the parsed tree. Indexing, len, iteration, equality and repr behave like the tuple the node replaces,
+    (parse_type, *fields), so code written against tuples keeps working. lexpos and lineno are those of the node's
+    first token and take no part in equality.
+    """
+    __slots__ = ("lexpos", "lineno")
+    parse_type = None
+    fields = ()
+
+    def as_tuple(self):
+        return (self.parse_type,) + tuple(getattr(self, field) for field in self.fields)
+
+    def __getitem__(self, index):
+        if index == 0:
+            return self.parse_type
+        if type(index) == int and index > 0:
+            return getattr(self, self.fields[index - 1])
+        return self.as_tuple()[index]
+
+    def __len__(self):
+        return len(self.fields) + 1
+
+    def __iter__(self):
+        return iter(self.as_tuple())
+
+    def __eq__(self, other):
+        if isinstance(other, Node):
+            return self.parse_type == other.parse_type and \
+                all(getattr(self, field) == getattr(other, field) for field in self.fields)
+        if isinstance(other, tuple):
+            return self.as_tuple() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return repr(self.as_tuple())
+
+
+class ListNode(Node):
+    __slots__ = ("items", "_count", "_last_item", "_has_new_lines")
+    parse_type = ParseTypes.LIST
+    fields = ("items",)
+
+    def __init__(self, items, lexpos=0, lineno=0):
+        self.items = items
+        self._count = None
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+    def _count_items(self):
+        count = 0
+        last_item = None
+        has_new_lines = False
+        for item in self.items:
+            if item[0] != ParseTypes.NEW_LINE and item[0] != ParseTypes.DOUBLE_NEWLINE:
+                count += 1
+                last_item = item
+            else:
+                has_new_lines = True
+        self._count, self._last_item, self._has_new_lines = count, last_item, has_new_lines
+
+    @property
+    def count(self):
+        """
+        Number of items that aren't NEW_LINE or DOUBLE_NEWLINE, counted once the tree is complete.
+        """
+        if self._count is None:
+            self._count_items()
+        return self._count
+
+    @property
+    def last_item(self):
+        """
+        Last item that isn't NEW_LINE or DOUBLE_NEWLINE.
+        """
+        if self._count is None:
+            self._count_items()
+        return self._last_item
+
+    @property
+    def has_new_lines(self):
+        if self._count is None:
+            self._count_items()
+        return self._has_new_lines
+
+
+class AssignmentNode(Node):
+    __slots__ = ("operator", "key", "value")
+    parse_type = ParseTypes.ASSIGNMENT
+    fields = ("operator", "key", "value")
+
+    def __init__(self, operator, key, value, lexpos=0, lineno=0):
+        self.operator = operator
+        self.key = key
+        self.value = value
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class ElementNode(Node):
+    __slots__ = ("value",)
+    parse_type = ParseTypes.ELEMENT
+    fields = ("value",)
+
+    def __init__(self, value, lexpos=0, lineno=0):
+        self.value = value
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class FullLineCommentNode(Node):
+    __slots__ = ("text",)
+    parse_type = ParseTypes.FULL_LINE_COMMENT
+    fields = ("text",)
+
+    def __init__(self, text, lexpos=0, lineno=0):
+        self.text = text
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class CommentNode(Node):
+    __slots__ = ("node", "comment")
+    parse_type = ParseTypes.COMMENT
+    fields = ("node", "comment")
+
+    def __init__(self, node, comment, lexpos=0, lineno=0):
+        self.node = node
+        self.comment = comment
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class ObjectNode(Node):
+    __slots__ = ("begin", "body", "end")
+    parse_type = ParseTypes.OBJECT
+    fields = ("begin", "body", "end")
+
+    def __init__(self, begin, body, end, lexpos=0, lineno=0):
+        self.begin = begin
+        self.body = body  # a ListNode, or an empty list for {}
+        self.end = end
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+    @property
+    def count(self):
+        return self.body.count if self.body else 0
+
+
+class BeginNode(Node):
+    __slots__ = ("brace",)
+    parse_type = ParseTypes.BEGIN
+    fields = ("brace",)
+
+    def __init__(self, brace, lexpos=0, lineno=0):
+        self.brace = brace
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class BeginCommentNode(Node):
+    __slots__ = ("brace", "comment")
+    parse_type = ParseTypes.BEGIN_COMMENT
+    fields = ("brace", "comment")
+
+    def __init__(self, brace, comment, lexpos=0, lineno=0):
+        self.brace = brace
+        self.comment = comment
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class EndNode(Node):
+    __slots__ = ("brace",)
+    parse_type = ParseTypes.END
+    fields = ("brace",)
+
+    def __init__(self, brace, lexpos=0, lineno=0):
+        self.brace = brace
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class EndCommentNode(Node):
+    __slots__ = ("brace", "comment")
+    parse_type = ParseTypes.END_COMMENT
+    fields = ("brace", "comment")
+
+    def __init__(self, brace, comment, lexpos=0, lineno=0):
+        self.brace = brace
+        self.comment = comment
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class DoubleNewlineNode(Node):
+    __slots__ = ("text",)
+    parse_type = ParseTypes.DOUBLE_NEWLINE
+    fields = ("text",)
+
+    def __init__(self, text, lexpos=0, lineno=0):
+        self.text = text
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+class NewLineNode(Node):
+    __slots__ = ("text",)
+    parse_type = ParseTypes.NEW_LINE
+    fields = ("text",)
+
+    def __init__(self, text, lexpos=0, lineno=0):
+        self.text = text
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+def item_count(list_element):
+    """
+    (count, last item, has new lines) of a LIST element, see ListNode, also for elements written as tuples.
+    """
+    if isinstance(list_element, ListNode):
+        return list_element.count, list_element.last_item, list_element.has_new_lines
+    count = 0
+    last_item = None
+    has_new_lines = False
+    for item in list_element[1]:
+        if item[0] != ParseTypes.NEW_LINE and item[0] != ParseTypes.DOUBLE_NEWLINE:
+            count += 1
+            last_item = item
+        else:
+            has_new_lines = True
+    return count, last_item, has_new_lines
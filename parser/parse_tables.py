@@ -0,0 +1,211 @@
+import hashlib
+import os
+import pickle
+import re
+import sys
+import types
+from ply import __version__ as ply_version, lex, yacc
+from file_utils import atomic_write
+
+TABLES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+# Bump whenever the layout of the cached tables changes
+TABLES_VERSION = 1
+
+
+class CachedProduction:
+    """
+    The part of a yacc.Production the LR parser uses while parsing.
+    """
+    __slots__ = ("name", "len", "func", "callable", "str")
+
+    def __init__(self, name, length, func, string, module_dict):
+        self.name = name
+        self.len = length
+        self.func = func
+        self.callable = module_dict[func] if func else None
+        self.str = string
+
+    def __str__(self):
+        return self.str
+
+    def __repr__(self):
+        return 'Production(' + self.str + ')'
+
+
+def grammar_signature(module_dict):
+    """
+    Hash of everything lex and yacc build their tables from: the tokens, literals, states, start symbol and
+    precedence, the t_ and p_ rules with their regular expressions and grammar docstrings, and the versions of PLY and
+    Python. Rule functions go in the order they're defined in, which is the order lex tries them and the one yacc
+    resolves reduce/reduce conflicts by, so reordering them changes the signature.
+
+    >>> def rules(source):
+    ...     module_dict = {"tokens": ("A", "B")}
+    ...     exec(source, module_dict)
+    ...     return module_dict
+    >>> a_first = rules("def t_A(t):\\n    r'a'\\ndef t_B(t):\\n    r'a|b'\\n")
+    >>> b_first = rules("def t_B(t):\\n    r'a|b'\\ndef t_A(t):\\n    r'a'\\n")
+    >>> grammar_signature(a_first) == grammar_signature(b_first)
+    False
+    """
+    parts = [str(TABLES_VERSION), ply_version, sys.version, repr(module_dict.get("tokens")),
+             repr(module_dict.get("literals")), repr(module_dict.get("states")), repr(module_dict.get("start")),
+             repr(module_dict.get("precedence"))]
+    rules = [(name, value) for name, value in module_dict.items() if name.startswith("t_") or name.startswith("p_")]
+    functions = sorted(((name, value) for name, value in rules if isinstance(value, types.FunctionType)),
+                       key=lambda rule: rule[1].__code__.co_firstlineno)
+    for name, value in functions:
+        parts.append(f"{name}:{value.__doc__}")
+    # lex orders string rules by the length of their regular expression, not where they're defined
+    for name, value in sorted(rules):
+        if not isinstance(value, types.FunctionType):
+            parts.append(f"{name}={value!r}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _tables_path(module_dict):
+    name = module_dict["__name__"].rsplit(".", 1)[-1]
+    return os.path.join(TABLES_FOLDER, f"{name}-{grammar_signature(module_dict)}.pickle")
+
+
+def _load_tables(path):
+    try:
+        with open(path, "rb") as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _store_tables(path, tables):
+    atomic_write(path, pickle.dumps(tables, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def build(module):
+    """
+    Return the (lexer, parser) of a PLY grammar module, like lex.lex and yacc.yacc do, from tables cached under
+    TABLES_FOLDER. The tables are built and stored the first time and whenever the grammar signature changes.
+    """
+    module_dict = vars(module)
+    path = _tables_path(module_dict)
+    tables = _load_tables(path)
+    if tables is not None:
+        try:
+            lexer = _lexer_from_tables(tables["lexer"], module_dict)
+            parser = _parser_from_tables(tables["parser"], module_dict)
+        except (KeyError, TypeError):
+            pass  # written by a version that doesn't match the module anymore, rebuild it
+        else:
+            # lex.lex and yacc.yacc leave these behind, parser.parse falls back on lex.lexer without a lexer argument
+            lex.lexer, lex.token, lex.input = lexer, lexer.token, lexer.input
+            yacc.parse = parser.parse
+            return lexer, parser
+
+    lexer = lex.lex(module=module)
+    parser = yacc.yacc(module=module)
+    try:
+        _store_tables(path, {"lexer": _lexer_tables(lexer), "parser": _parser_tables(parser)})
+    except OSError:
+        pass  # a read only checkout still works, just without the cache
+    return lexer, parser
+
+
+def _lexer_tables(lexer):
+    return {
+        "tokens": sorted(lexer.lextokens),
+        "literals": lexer.lexliterals,
+        "stateinfo": lexer.lexstateinfo,
+        "retext": lexer.lexstateretext,
+        "renames": lexer.lexstaterenames,
+        # the rule function and token of every group of the master regular expressions
+        "findex": {state: [[None if entry is None else (entry[0].__name__ if entry[0] else None, entry[1])
+                            for entry in lexindexfunc] for _, lexindexfunc in lexre]
+                   for state, lexre in lexer.lexstatere.items()},
+        "reflags": lexer.lexreflags,
+        "ignore": lexer.lexstateignore,
+        "errorf": {state: function.__name__ if function else None for state, function in lexer.lexstateerrorf.items()},
+        "eoff": {state: function.__name__ if function else None for state, function in lexer.lexstateeoff.items()},
+    }
+
+
+def _lexer_from_tables(tables, module_dict):
+    lexer = lex.Lexer()
+    lexer.lextokens = set(tables["tokens"])
+    lexer.lexliterals = tables["literals"]
+    lexer.lextokens_all = lexer.lextokens | set(lexer.lexliterals)
+    lexer.lexstateinfo = tables["stateinfo"]
+    lexer.lexstateretext = tables["retext"]
+    lexer.lexstaterenames = tables["renames"]
+    lexer.lexreflags = tables["reflags"]
+    for state, texts in tables["retext"].items():
+        lexer.lexstatere[state] = [
+            (re.compile(text, lexer.lexreflags),
+             [None if entry is None else (module_dict[entry[0]] if entry[0] else None, entry[1]) for entry in findex])
+            for text, findex in zip(texts, tables["findex"][state])]
+    lexer.lexre = lexer.lexstatere["INITIAL"]
+    lexer.lexretext = lexer.lexstateretext["INITIAL"]
+    lexer.lexstateignore = tables["ignore"]
+    lexer.lexignore = lexer.lexstateignore.get("INITIAL", "")
+    lexer.lexstateerrorf = {state: module_dict[name] if name else None for state, name in tables["errorf"].items()}
+    lexer.lexerrorf = lexer.lexstateerrorf.get("INITIAL", None)
+    lexer.lexstateeoff = {state: module_dict[name] if name else None for state, name in tables["eoff"].items()}
+    lexer.lexeoff = lexer.lexstateeoff.get("INITIAL", None)
+    return lexer
+
+
+def _parser_tables(parser):
+    return {
+        "productions": [(production.name, production.len, production.func, production.str)
+                        if production else None for production in parser.productions],
+        "action": parser.action,
+        "goto": parser.goto,
+        "errorf": parser.errorfunc.__name__ if parser.errorfunc else None,
+    }
+
+
+def _parser_from_tables(tables, module_dict):
+    productions = [CachedProduction(*production, module_dict) if production else None
+                   for production in tables["productions"]]
+    lr_table = types.SimpleNamespace(lr_productions=productions, lr_action=tables["action"], lr_goto=tables["goto"])
+    return yacc.LRParser(lr_table, module_dict[tables["errorf"]] if tables["errorf"] else None)
+
+
+def compare_import_times(runs=10):
+    """
+    Time importing victoria_script_parses in fresh interpreters, building the tables every time against loading
+    them from the cache. Only the stored tables of victoria_script_parses are removed, the rest of TABLES_FOLDER is
+    other caches.
+    """
+    import glob
+    import statistics
+    import subprocess
+    import time
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+
+    def time_import():
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import victoria_script_parses"], cwd=folder, check=True)
+        return time.perf_counter() - start
+
+    def time_baseline():
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import ply.lex, ply.yacc"], cwd=folder, check=True)
+        return time.perf_counter() - start
+
+    baseline = statistics.median(time_baseline() for _ in range(runs))
+    built = []
+    for _ in range(runs):
+        for path in glob.glob(os.path.join(TABLES_FOLDER, "victoria_script_parses-*.pickle")):
+            os.remove(path)
+        built.append(time_import())
+    cached = [time_import() for _ in range(runs)]
+
+    print(f"interpreter and PLY import:  {baseline * 1000:8.1f} ms")
+    print(f"import building the tables:  {statistics.median(built) * 1000:8.1f} ms "
+          f"(+{(statistics.median(built) - baseline) * 1000:.1f} ms)")
+    print(f"import loading cached tables:{statistics.median(cached) * 1000:8.1f} ms "
+          f"(+{(statistics.median(cached) - baseline) * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    compare_import_times()
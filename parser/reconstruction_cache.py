@@ -0,0 +1,150 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+import iterative_reconstructor
+import victoria_script_reconstructor
+from file_utils import atomic_write
+from parse_nodes import Node
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DEFAULT_PATH = os.path.join(CACHE_FOLDER, "reconstruction.pickle")
+# Bump whenever the layout of the cache file changes
+CACHE_VERSION = 1
+# The config values reconstruction reads, nothing else in a config changes the output
+CONFIG_KEYS = ("default_no_double_line", "default_yes_double_line", "object_yes_double_line",
+               "force_single_line_until_item_count", "force_multi_line_from_item_count")
+# Total length of the texts kept, the least recently used ones go first beyond it
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+def reconstructor_signature():
+    """
+    Hash of the source of both reconstruction engines, which share the cache, texts cached by a different version of
+    either are dropped on load.
+    """
+    signature = hashlib.sha256()
+    for module in (victoria_script_reconstructor, iterative_reconstructor):
+        with open(module.__file__, "rb") as file:
+            signature.update(file.read())
+    return signature.hexdigest()[:16]
+
+
+def fingerprint(element):
+    """
+    The structure of element as a flat list: node class names, the tuple element types, list lengths and the
+    strings, in the order they're met. Positions are left out, so moving an element doesn't change it.
+    """
+    parts = []
+    append = parts.append
+    stack = [element]
+    pop = stack.pop
+    while stack:
+        node = pop()
+        if isinstance(node, Node):
+            append(type(node).__name__)
+            for field in reversed(node.fields):
+                stack.append(getattr(node, field))
+        elif type(node) is str:
+            append(node)
+        elif isinstance(node, tuple):
+            append(int(node[0]))
+            stack.extend(reversed(node[1:]))
+        elif isinstance(node, list):
+            append(-len(node) - 1)
+            stack.extend(reversed(node))
+        else:
+            append(repr(node))
+    return parts
+
+
+class ReconstructionCache:
+    """
+    Texts of reconstructed top level elements, keyed by a hash of the element's structure, which leaves out its
+    position in the file, of the state it's reconstructed in and of the config values. Kept in least recently used
+    order up to max_size characters and stored in path between runs.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self._new_keys = []
+        if path is not None:
+            self.load()
+
+    @staticmethod
+    def key(element, state, config):
+        text = repr((fingerprint(element), tuple(state), tuple(config[key] for key in CONFIG_KEYS)))
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def render(self, element, state, config, render):
+        """
+        The text of element, from the cache or from render(element, state, config), which is cached then.
+        """
+        key = self.key(element, state, config)
+        text = self.entries.get(key)
+        if text is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+        self.misses += 1
+        text = render(element, state, config)
+        self.entries[key] = text
+        self._new_keys.append(key)
+        self.size += len(text)
+        self._evict()
+        return text
+
+    def take_new(self):
+        """
+        (hits, misses, entries) since the last call, what a worker process hands back to be merged into the cache of
+        the main one.
+        """
+        taken = (self.hits, self.misses,
+                 [(key, self.entries[key]) for key in self._new_keys if key in self.entries])
+        self.hits = self.misses = 0
+        self._new_keys = []
+        return taken
+
+    def merge(self, hits, misses, entries):
+        self.hits += hits
+        self.misses += misses
+        for key, text in entries:
+            if key not in self.entries:
+                self.entries[key] = text
+                self.size += len(text)
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_size and self.entries:
+            _, text = self.entries.popitem(last=False)
+            self.size -= len(text)
+            self.evictions += 1
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                stored = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        if stored.get("version") != CACHE_VERSION or stored.get("signature") != reconstructor_signature():
+            return
+        self.entries = OrderedDict(stored["entries"])
+        self.size = sum(len(text) for text in self.entries.values())
+        self._evict()
+
+    def save(self):
+        atomic_write(self.path, pickle.dumps({"version": CACHE_VERSION, "signature": reconstructor_signature(),
+                                              "entries": list(self.entries.items())},
+                                             protocol=pickle.HIGHEST_PROTOCOL))
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        return (f"reconstruction cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hits), "
+                f"{len(self.entries)} entries, {self.size} characters, {self.evictions} evicted")
@@ -0,0 +1,219 @@
+from ply import lex
+import victoria_script_parses
+from parse_nodes import ListNode, AssignmentNode, ElementNode, FullLineCommentNode, CommentNode, ObjectNode, \
+    BeginNode, BeginCommentNode, EndNode, EndCommentNode, DoubleNewlineNode, NewLineNode
+
+# Tokens an assignment can start with, inside objects an object can start there as well
+ASSIGNMENT_START = frozenset(("BASIC_WORD", "NEW_LINE", "COMMENT"))
+
+
+class _SyntaxError(Exception):
+    pass
+
+
+class _ReplayLexer:
+    """
+    Hands the PLY parser the tokens already read before reading on with the lexer.
+    """
+
+    def __init__(self, tokens, lexer):
+        self.tokens = iter(tokens)
+        self.lexer = lexer
+
+    def input(self, data):
+        pass
+
+    def token(self):
+        return next(self.tokens, None) or self.lexer.token()
+
+    def __getattr__(self, name):
+        # p_error reads the lexer state through the tokens PLY attaches this lexer to
+        return getattr(self.lexer, name)
+
+
+class RecursiveDescentParser:
+    """
+    Hand written parser of the victoria_script_parses grammar giving the same ParseTypes tuples as its PLY parser.
+    The grammar's shift/reduce conflicts all resolve as shift, which here means every rule takes as many COMMENT and
+    NEW_LINE tokens as it can. Input with a syntax error is handed over to the PLY parser, so its error reporting and
+    recovery stay the same, as is input nested too deep for Python's recursion limit.
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback if fallback is not None else victoria_script_parses.parser
+
+    def parse(self, input=None, lexer=None, debug=False, tracking=False):
+        if not lexer:
+            lexer = lex.lexer
+        if input is not None:
+            lexer.input(input)
+
+        self._lexer = lexer
+        self._read = []
+        self._token = lexer.token()
+        if self._token is not None:
+            self._read.append(self._token)
+        try:
+            return self._program()
+        except (_SyntaxError, RecursionError):
+            return self.fallback.parse(lexer=_ReplayLexer(self._read, lexer), debug=debug, tracking=tracking)
+        finally:
+            self._read = self._token = self._lexer = None
+
+    def parse_items(self, lexer, stop):
+        """
+        Parse top level items from where the lexer is until stop(lexpos) is true for the token an item would start
+        at, or the input ends. Returns the items and the lexpos they stopped at, None at the end of the input, or
+        None on a syntax error, which is left to a full parse to report, or nesting too deep to recurse through.
+        """
+        self._lexer = lexer
+        self._read = []
+        self._token = lexer.token()
+        items = []
+        try:
+            while self._token is not None and not stop(self._token.lexpos):
+                if self._token.type not in ASSIGNMENT_START:
+                    raise _SyntaxError
+                items.append(self._assignment())
+        except (_SyntaxError, RecursionError):
+            return None
+        else:
+            return items, self._token.lexpos if self._token is not None else None
+        finally:
+            self._read = self._token = self._lexer = None
+
+    def _advance(self):
+        token = self._token
+        self._token = self._lexer.token()
+        if self._token is not None:
+            self._read.append(self._token)
+        return token.value
+
+    def _type(self):
+        return self._token.type if self._token is not None else None
+
+    def _program(self):
+        assignments = []
+        while self._token is not None:
+            if self._token.type not in ASSIGNMENT_START:
+                raise _SyntaxError
+            assignments.append(self._assignment())
+        if not assignments:
+            raise _SyntaxError
+        return ListNode(assignments, assignments[0].lexpos, assignments[0].lineno)
+
+    def _assignment(self):
+        token = self._token
+        token_type = token.type
+        if token_type == "BASIC_WORD":
+            word = self._advance()
+            if self._type() == "DIVIDER":
+                divider = self._advance()
+                node = AssignmentNode(divider, word, self._value(), token.lexpos, token.lineno)
+            else:
+                node = ElementNode(word, token.lexpos, token.lineno)
+        elif token_type == "NEW_LINE":
+            new_lines = self._advance()
+            if self._type() == "NEW_LINE":
+                while self._type() == "NEW_LINE":
+                    new_lines += self._advance()
+                if self._type() == "COMMENT":
+                    node = FullLineCommentNode(new_lines + self._advance(), token.lexpos, token.lineno)
+                else:
+                    node = DoubleNewlineNode(new_lines, token.lexpos, token.lineno)
+            elif self._type() == "COMMENT":
+                node = FullLineCommentNode(new_lines + self._advance(), token.lexpos, token.lineno)
+            else:
+                node = NewLineNode(new_lines, token.lexpos, token.lineno)
+        else:
+            node = FullLineCommentNode(self._advance(), token.lexpos, token.lineno)
+
+        while self._type() == "COMMENT":
+            node = CommentNode(node, self._advance(), token.lexpos, token.lineno)
+        return node
+
+    def _value(self):
+        token = self._token
+        token_type = self._type()
+        if token_type == "BASIC_WORD":
+            return ElementNode(self._advance(), token.lexpos, token.lineno)
+        if token_type == "BEGIN_DICT":
+            return self._object()
+        raise _SyntaxError
+
+    def _object(self):
+        token = self._token
+        brace = self._advance()
+        if self._type() == "COMMENT":
+            begin = BeginCommentNode(brace, self._advance(), token.lexpos, token.lineno)
+        else:
+            begin = BeginNode(brace, token.lexpos, token.lineno)
+
+        assignments = []
+        while True:
+            token_type = self._type()
+            if token_type in ASSIGNMENT_START:
+                assignments.append(self._assignment())
+            elif token_type == "BEGIN_DICT":
+                assignments.append(self._object())
+            else:
+                break
+
+        end_token = self._token
+        if self._type() != "END_DICT":
+            raise _SyntaxError
+        brace = self._advance()
+        if self._type() == "COMMENT":
+            end = EndCommentNode(brace, self._advance(), end_token.lexpos, end_token.lineno)
+        else:
+            end = EndNode(brace, end_token.lexpos, end_token.lineno)
+
+        if assignments:
+            body = ListNode(assignments, assignments[0].lexpos, assignments[0].lineno)
+            return ObjectNode(begin, body, end, token.lexpos, token.lineno)
+        return ObjectNode(begin, [], end, token.lexpos, token.lineno)
+
+parser = RecursiveDescentParser()
+
+
+def compare_with_ply(folder_path):
+    """
+    Parse every .txt file of a folder with both parsers and list the files they disagree on, which must be none
+    before the recursive descent parser is used for formatting.
+    """
+    import os
+    import time
+
+    files = 0
+    mismatches = []
+    timings = {"ply": 0.0, "recursive_descent": 0.0}
+    for root, _, file_names in os.walk(folder_path):
+        for file_name in file_names:
+            if not file_name.endswith('.txt'):
+                continue
+            file_path = os.path.join(root, file_name)
+            with open(file_path, 'r', encoding='utf-8-sig') as file:
+                content = file.read()
+            files += 1
+
+            results = {}
+            for name, backend in (("ply", victoria_script_parses.parser), ("recursive_descent", parser)):
+                victoria_script_parses.lexer.lineno = 1
+                start = time.perf_counter()
+                results[name] = backend.parse(content)
+                timings[name] += time.perf_counter() - start
+            if results["ply"] != results["recursive_descent"]:
+                mismatches.append(file_path)
+
+    print(f"{files} files, {len(mismatches)} mismatches")
+    for file_path in mismatches:
+        print("MISMATCH", file_path)
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.2f} s")
+    return mismatches
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(1 if compare_with_ply(sys.argv[1]) else 0)
@@ -1,5 +1,8 @@
-from ply import yacc, lex
-from enum import IntEnum, auto
+import copyreg
+import sys
+import parse_tables
+from parse_nodes import ParseTypes, Node, ListNode, AssignmentNode, ElementNode, FullLineCommentNode, \
+    CommentNode, ObjectNode, BeginNode, BeginCommentNode, EndNode, EndCommentNode, DoubleNewlineNode, NewLineNode
 
 # --- Tokenizer
 
@@ -52,23 +55,14 @@ def t_error(t):
     t.lexer.skip(1)
 
 
-# Build the lexer object
-lexer = lex.lex()
-
+def _span(p):
+    """
+    lexpos and lineno of the first symbol of a rule, tokens carry them and nodes copy them from their first token.
+    """
+    if isinstance(p[1], Node):
+        return p[1].lexpos, p[1].lineno
+    return p.lexpos(1), p.lineno(1)
 
-class ParseTypes(IntEnum):
-    LIST = auto()
-    ASSIGNMENT = auto()
-    ELEMENT = auto()
-    FULL_LINE_COMMENT = auto()
-    COMMENT = auto()
-    OBJECT = auto()
-    BEGIN = auto()
-    BEGIN_COMMENT = auto()
-    END = auto()
-    END_COMMENT = auto()
-    DOUBLE_NEWLINE = auto()
-    NEW_LINE = auto()
 
 def p_program(p):
     """
@@ -76,38 +70,41 @@ def p_program(p):
             | program assignment
     """
     if len(p) == 2:
-        p[0] = (ParseTypes.LIST, [p[1]])
+        p[0] = ListNode([p[1]], *_span(p))
     else:
-        p[0] = (ParseTypes.LIST, p[1][1] + [p[2]])
+        # append to the list of the left hand side, copying it would make long lists quadratic
+        p[1].items.append(p[2])
+        p[0] = p[1]
 
 
 def p_assignment(p):
     """
     assignment : BASIC_WORD DIVIDER value
     """
-    p[0] = (ParseTypes.ASSIGNMENT, p[2], p[1], p[3])
+    p[0] = AssignmentNode(p[2], p[1], p[3], *_span(p))
 
 
 def p_assignment_identifier(p):
     """assignment : BASIC_WORD"""
-    p[0] = (ParseTypes.ELEMENT, p[1])  # Or a default value instead of None
+    p[0] = ElementNode(p[1], *_span(p))  # Or a default value instead of None
 
 
 def p_standalone_comment(p):
     """assignment : NEW_LINE COMMENT
                   | double_newline COMMENT
                   | COMMENT"""
+    span = _span(p)
     if len(p) > 2:
-        if isinstance(p[1], tuple):
+        if isinstance(p[1], Node):
             p[1] = p[1][1]
-        p[0] = (ParseTypes.FULL_LINE_COMMENT, p[1] + p[2])  # Handling standalone comments
+        p[0] = FullLineCommentNode(p[1] + p[2], *span)  # Handling standalone comments
     else:
-        p[0] = (ParseTypes.FULL_LINE_COMMENT, p[1])
+        p[0] = FullLineCommentNode(p[1], *span)
 
 
 def p_attached_comment_assignment(p):
     """assignment : assignment COMMENT """
-    p[0] = (ParseTypes.COMMENT, p[1], p[2])  # Or a default value instead of None
+    p[0] = CommentNode(p[1], p[2], *_span(p))  # Or a default value instead of None
 
 
 def p_attached_comment_begin(p):
@@ -116,9 +113,9 @@ def p_attached_comment_begin(p):
                | BEGIN_DICT
     """
     if len(p) == 3:
-        p[0] = (ParseTypes.BEGIN_COMMENT, p[1], p[2])
+        p[0] = BeginCommentNode(p[1], p[2], *_span(p))
     else:
-        p[0] = (ParseTypes.BEGIN, p[1])
+        p[0] = BeginNode(p[1], *_span(p))
 
 
 def p_attached_comment_end(p):
@@ -127,16 +124,16 @@ def p_attached_comment_end(p):
              | END_DICT
     """
     if len(p) == 3:
-        p[0] = (ParseTypes.END_COMMENT, p[1], p[2])
+        p[0] = EndCommentNode(p[1], p[2], *_span(p))
     else:
-        p[0] = (ParseTypes.END, p[1])
+        p[0] = EndNode(p[1], *_span(p))
 
 
 def p_promote_2(p):
     """
     value : BASIC_WORD
     """
-    p[0] = (ParseTypes.ELEMENT, p[1])
+    p[0] = ElementNode(p[1], *_span(p))
 
 
 def p_promote(p):
@@ -152,9 +149,9 @@ def p_map(p):
            | begin_dict end_dict
     """
     if len(p) == 4:
-        p[0] = (ParseTypes.OBJECT, p[1], p[2], p[3])
+        p[0] = ObjectNode(p[1], p[2], p[3], *_span(p))
     else:
-        p[0] = (ParseTypes.OBJECT, p[1], [], p[2])
+        p[0] = ObjectNode(p[1], [], p[2], *_span(p))
 
 
 def p_assignments_single(p):
@@ -163,9 +160,11 @@ def p_assignments_single(p):
                 | assignments assignment
     """
     if len(p) == 2:
-        p[0] = (ParseTypes.LIST, [p[1]])
+        p[0] = ListNode([p[1]], *_span(p))
     else:
-        p[0] = (ParseTypes.LIST, p[1][1] + [p[2]])
+        # append to the list of the left hand side, copying it would make long lists quadratic
+        p[1].items.append(p[2])
+        p[0] = p[1]
 
 
 def p_assignments_object(p):
@@ -174,9 +173,11 @@ def p_assignments_object(p):
                 | assignments object
     """
     if len(p) == 2:
-        p[0] = (ParseTypes.LIST, [p[1]])
+        p[0] = ListNode([p[1]], *_span(p))
     else:
-        p[0] = (ParseTypes.LIST, p[1][1] + [p[2]])
+        # append to the list of the left hand side, copying it would make long lists quadratic
+        p[1].items.append(p[2])
+        p[0] = p[1]
 
 
 def p_double_new_line(p):
@@ -184,9 +185,10 @@ def p_double_new_line(p):
     double_newline : NEW_LINE NEW_LINE
                    | double_newline NEW_LINE
     """
-    if isinstance(p[1], tuple):
+    span = _span(p)
+    if isinstance(p[1], Node):
         p[1] = p[1][1]
-    p[0] = (ParseTypes.DOUBLE_NEWLINE, p[1] + p[2])
+    p[0] = DoubleNewlineNode(p[1] + p[2], *span)
 
 
 def p_double_new_line_promote(p):
@@ -200,7 +202,7 @@ def p_new_line(p):
     """
     assignment : NEW_LINE
     """
-    p[0] = (ParseTypes.NEW_LINE, p[1])
+    p[0] = NewLineNode(p[1], *_span(p))
 
 
 def p_error(p):
@@ -216,5 +218,19 @@ def p_error(p):
         print("Syntax error at EOF")
 
 
-# Build the parser
-parser = yacc.yacc()
+# Build the lexer and the parser, their tables are cached between runs
+lexer, parser = parse_tables.build(sys.modules[__name__])
+
+
+def _module_parser():
+    return parser
+
+
+def _reduce_parser(instance):
+    # p_error reads the parse stack of the module's parser, so a worker process unpickles it as its own module parser
+    if instance is parser:
+        return _module_parser, ()
+    return object.__reduce_ex__(instance, 2)
+
+
+copyreg.pickle(type(parser), _reduce_parser)
@@ -1,6 +1,7 @@
 from collections import namedtuple
 from typing import Callable, List
 
+from parse_nodes import Node, item_count
 from victoria_script_parses import ParseTypes
 
 reconstruction_functions: List[Callable] = [Callable] * len(ParseTypes)
@@ -29,17 +30,14 @@ def create_tabs(state):
 
 
 @register_reconstruction_function
-def reconstruct_list(element, state, config, function):
+def reconstruct_list(element, state, config, function, write):
     final_list = element[1]
     currently_no_newlines_in_list = True
     if config["force_single_line_until_item_count"] is not None or config[
         "force_multi_line_from_item_count"] is not None:
-        count = 0
-        for e in element[1]:
-            if e[0] != ParseTypes.NEW_LINE and e[0] != ParseTypes.DOUBLE_NEWLINE:
-                count += 1
-            else:
-                currently_no_newlines_in_list = False
+        count, _, has_new_lines = item_count(element)
+        if has_new_lines:
+            currently_no_newlines_in_list = False
 
     if config["force_single_line_until_item_count"] is not None and count <= config[
         "force_single_line_until_item_count"]:
@@ -67,29 +65,25 @@ def reconstruct_list(element, state, config, function):
             final_list.append((ParseTypes.NEW_LINE, "\n"))
 
     if not final_list:
-        return ""
+        return
 
 
     default_no_new_lines = not (final_list[0][0] == ParseTypes.NEW_LINE or final_list[0][
         0] == ParseTypes.DOUBLE_NEWLINE or final_list[0][0] == ParseTypes.FULL_LINE_COMMENT) and state.level > 0
 
     new_state = state._replace(no_new_lines=default_no_new_lines, currently_no_newlines_in_list=currently_no_newlines_in_list)
-    string = ""
     if new_state.no_new_lines:
-        string += " "
+        write(" ")
 
     for i, item in enumerate(final_list):
         if item[0] == ParseTypes.ASSIGNMENT and item[3][0] == ParseTypes.OBJECT and item[3][2]:
-            count = 0
-            for e in item[3][2][1]:
-                if e[0] != ParseTypes.NEW_LINE and e[0] != ParseTypes.DOUBLE_NEWLINE:
-                    count += 1
+            count, _, _ = item_count(item[3][2])
             new_state = new_state._replace(item_count_object=count)
 
-        string += f"{function(item, state=new_state, config=config)}"
+        function(item, state=new_state, config=config, write=write)
 
         if new_state.no_new_lines:
-            string += " "
+            write(" ")
 
         # Objects after Objects should have a whitespace between them
         if len(item) > 3 and item[3][0] == ParseTypes.OBJECT and len(final_list) > i + 2 and len(
@@ -102,42 +96,43 @@ def reconstruct_list(element, state, config, function):
         else:
             new_state = new_state._replace(after_end_of_object=False, after_last_object=False)
 
-    return string
-
 
 @register_reconstruction_function
-def reconstruct_assignment(element, state, config, function):
+def reconstruct_assignment(element, state, config, function, write):
     tabs = create_tabs(state)
     new_state = state._replace(no_new_lines=True)
-    return f"{tabs}{element[2]} {element[1]} {function(element[3], state=new_state, config=config)}"
+    write(f"{tabs}{element[2]} {element[1]} ")
+    function(element[3], state=new_state, config=config, write=write)
 
 
 # assumed endpoint
 @register_reconstruction_function
-def reconstruct_element(element, state, config, function):
+def reconstruct_element(element, state, config, function, write):
     tabs = create_tabs(state)
-    return f"{tabs}{element[1]}"
+    write(f"{tabs}{element[1]}")
 
 
 # Contains possibly multiple lines of comment
 @register_reconstruction_function
-def reconstruct_full_line_comment(element, state, config, function):
+def reconstruct_full_line_comment(element, state, config, function, write):
     tabs = create_tabs(state)
     string_list = element[1].split('\n')
     string_list[-1] = tabs + string_list[-1]
-    return "\n".join(string_list)
+    write("\n".join(string_list))
 
 
 @register_reconstruction_function
-def reconstruct_comment(element, state, config, function):
-    return f"{function(element[1], state=state, config=config)}\t{element[2]}"
+def reconstruct_comment(element, state, config, function, write):
+    function(element[1], state=state, config=config, write=write)
+    write(f"\t{element[2]}")
 
 
 @register_reconstruction_function
-def reconstruct_object(element, state, config, function):
+def reconstruct_object(element, state, config, function, write):
     if not element[2]:  # empty
         new_state = state._replace(no_new_lines=True)
-        return f"{function(element[1], state=new_state, config=config)}{function(element[3], state=new_state, config=config)}"
+        function(element[1], state=new_state, config=config, write=write)
+        function(element[3], state=new_state, config=config, write=write)
     else:
         # newline before object close
         if (element[2][1][-1][0] == ParseTypes.NEW_LINE or element[2][1][-1][
@@ -149,12 +144,7 @@ def reconstruct_object(element, state, config, function):
 
         if config["force_single_line_until_item_count"] is not None or config[
             "force_multi_line_from_item_count"] is not None:
-            count = 0
-            last_item = None
-            for e in element[2][1]:
-                if e[0] != ParseTypes.NEW_LINE and e[0] != ParseTypes.DOUBLE_NEWLINE:
-                    count += 1
-                    last_item = e
+            count, last_item, _ = item_count(element[2])
 
             # anticipate single line
             if config["force_single_line_until_item_count"] is not None and count <= config[
@@ -175,49 +165,51 @@ def reconstruct_object(element, state, config, function):
         new_state = state._replace(no_new_lines=False, level= state.level + 1)
         new_end_state = state._replace(no_new_lines=no_new_lines)
 
-        return f"{function(element[1], state=new_begin_state, config=config)}{function(element[2], state=new_state, config=config)}{function(element[3], state=new_end_state, config=config)}"
+        function(element[1], state=new_begin_state, config=config, write=write)
+        function(element[2], state=new_state, config=config, write=write)
+        function(element[3], state=new_end_state, config=config, write=write)
 
 
 @register_reconstruction_function
-def reconstruct_begin(element, state, config, function):
-    return element[1]
+def reconstruct_begin(element, state, config, function, write):
+    write(f"{element[1]}")
 
 
 @register_reconstruction_function
-def reconstruct_end(element, state, config, function):
+def reconstruct_end(element, state, config, function, write):
     tabs = create_tabs(state)
-    return f"{tabs}{element[1]}"
+    write(f"{tabs}{element[1]}")
 
 
 @register_reconstruction_function
-def reconstruct_begin_comment(element, state, config, function):
+def reconstruct_begin_comment(element, state, config, function, write):
     # print(state)
     string = f"{element[1]}\t{element[2]}"
     if state.no_new_lines:
         state = state._replace(no_new_lines=False, level=state.level+1)
         string += f"\n{create_tabs(state)}"
-    return string
+    write(string)
 
 
 @register_reconstruction_function
-def reconstruct_end_comment(element, state, config, function):
-    print(state)
+def reconstruct_end_comment(element, state, config, function, write):
     tabs = create_tabs(state)
-    return f"{tabs}{element[1]}\t{element[2]}"
+    write(f"{tabs}{element[1]}\t{element[2]}")
 
 
 @register_reconstruction_function
-def reconstruct_double_newline(element, state, config, function):
+def reconstruct_double_newline(element, state, config, function, write):
     tabs = create_tabs(state)
     if (state.after_last_object # never a double line just before }
             or (config["default_no_double_line"] and not (config["object_yes_double_line"] and state.after_end_of_object)) # overwrite default for objects if specified
             or (config["force_single_line_until_item_count"] and state.item_count_object <= config["force_single_line_until_item_count"])): # no double newline after a single line object
-        return f"\n"
-    return f"\n{tabs}\n"
+        write("\n")
+    else:
+        write(f"\n{tabs}\n")
 
 
 @register_reconstruction_function
-def reconstruct_new_line(element, state, config, function):
+def reconstruct_new_line(element, state, config, function, write):
     if (not state.after_last_object # never a double line just before }
         and ((
             config["default_yes_double_line"]
@@ -225,16 +217,42 @@ def reconstruct_new_line(element, state, config, function):
              or (config["force_multi_line_from_item_count"] and state.item_count_object > config["force_multi_line_from_item_count"] and state.after_end_of_object)) # overwrite default for object if specified
         )):
         tabs = create_tabs(state)
-        return f"\n{tabs}\n"
-    return f"\n"
+        write(f"\n{tabs}\n")
+    else:
+        write("\n")
 
 
-def reconstruct_any_object(element, state, config):
-    if isinstance(element, tuple):
-        return reconstruction_functions[element[0] - 1](element, state, config, reconstruct_any_object)
-    return ""
+def reconstruct_any_object(element, state, config, write):
+    if isinstance(element, (tuple, Node)):
+        reconstruction_functions[element[0] - 1](element, state, config, reconstruct_any_object, write)
 
 
-def reconstruct(parsed_data, config):
+def _render(element, state, config):
+    pieces = []
+    reconstruct_any_object(element, state, config, pieces.append)
+    return "".join(pieces)
+
+
+def reconstruct_to(stream, parsed_data, config, cache=None):
+    """
+    Write the reconstruction of parsed_data to stream piece by piece, stream is a list to append the pieces to or
+    an open text file. Nothing but the pieces of the element being written is held, so writing to a file takes
+    memory for the nesting depth only and time linear in the output. With a ReconstructionCache the top level
+    elements come from the cache when they were reconstructed before.
+    """
+    write = stream.append if isinstance(stream, list) else stream.write
+    state = State(0, False, False, False, False, 10000)
+    if cache is not None and isinstance(parsed_data, (tuple, Node)) and parsed_data[0] == ParseTypes.LIST:
+        def reconstruct_cached(element, state, config, write):
+            write(cache.render(element, state, config, _render))
+
+        reconstruction_functions[ParseTypes.LIST - 1](parsed_data, state, config, reconstruct_cached, write)
+        return
     # Start processing from the outermost layer
-    return reconstruct_any_object(parsed_data, State(0, False, False, False, False, 10000), config)
+    reconstruct_any_object(parsed_data, state, config, write)
+
+
+def reconstruct(parsed_data, config, cache=None):
+    pieces = []
+    reconstruct_to(pieces, parsed_data, config, cache)
+    return "".join(pieces)